@@ -0,0 +1,137 @@
+import asyncio
+import math
+import time
+from collections import deque
+import anyio.to_thread
+from fastapi import Depends, HTTPException, status
+from config import settings as stt
+
+# Weight of the last request in the moving average of the service time
+SERVICE_TIME_WEIGHT = 0.2
+
+
+class AdmissionClass:
+    """
+    Concurrency limit with a bounded wait queue for one priority class of routes.
+
+    At most `concurrency` requests of the class run at a time, at most `queue_size` more wait (first come,
+    first served) for at most `queue_timeout` seconds. Other requests are rejected right away, so an
+    overloaded class does not hold up the routes of the other classes.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiters = deque()
+        # Moving average of the time a request of the class holds its slot, in seconds
+        self.service_time = 0.1
+
+    def retry_after(self) -> int:
+        """
+        Estimate the number of seconds until the queue has drained.
+        """
+        return max(1, math.ceil((len(self.waiters) + 1) * self.service_time / self.concurrency))
+
+    def _reject(self, status_code: int, detail: str):
+        return HTTPException(status_code=status_code, detail=detail,
+                             headers={'Retry-After': str(self.retry_after())})
+
+    async def acquire(self) -> None:
+        """
+        Wait for a slot of the class.
+
+        :raises HTTPException: 429 if the wait queue is full, 503 if no slot was free within `queue_timeout`.
+        """
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            return
+        if len(self.waiters) >= self.queue_size:
+            raise self._reject(status.HTTP_429_TOO_MANY_REQUESTS, f"Too many {self.name} requests, retry later")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as error:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over at the same time; pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            if isinstance(error, asyncio.CancelledError):
+                raise
+            raise self._reject(status.HTTP_503_SERVICE_UNAVAILABLE,
+                               f"The server is busy with {self.name} requests, retry later")
+
+    def release(self) -> None:
+        """
+        Hand the slot over to the first waiting request, or free it.
+        """
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def record(self, elapsed: float) -> None:
+        self.service_time += SERVICE_TIME_WEIGHT * (elapsed - self.service_time)
+
+
+# Priority classes: cheap lookups, analytics over the dataset, uploads of booking data and bulk user imports
+# (which only write to the users table, so they do not wait behind a csv upload)
+CLASSES = {
+    'lookup': AdmissionClass('lookup', stt.ADMISSION_LOOKUP_CONCURRENCY, stt.ADMISSION_LOOKUP_QUEUE,
+                             stt.ADMISSION_QUEUE_TIMEOUT),
+    'analytics': AdmissionClass('analytics', stt.ADMISSION_ANALYTICS_CONCURRENCY, stt.ADMISSION_ANALYTICS_QUEUE,
+                                stt.ADMISSION_QUEUE_TIMEOUT),
+    'ingestion': AdmissionClass('ingestion', stt.ADMISSION_INGESTION_CONCURRENCY, stt.ADMISSION_INGESTION_QUEUE,
+                                stt.ADMISSION_QUEUE_TIMEOUT),
+    'import': AdmissionClass('import', stt.ADMISSION_IMPORT_CONCURRENCY, stt.ADMISSION_IMPORT_QUEUE,
+                             stt.ADMISSION_QUEUE_TIMEOUT),
+}
+
+
+def admission(priority_class: str):
+    """
+    Create a route dependency that admits the request into a priority class.
+
+    The slot is held until the response has been sent (including streamed responses).
+
+    :param priority_class: 'lookup', 'analytics', 'ingestion' or 'import'.
+    """
+    admission_class = CLASSES[priority_class]
+
+    async def admit():
+        await admission_class.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            admission_class.record(time.perf_counter() - started)
+            admission_class.release()
+
+    return admit
+
+
+lookup_admission = Depends(admission('lookup'))
+analytics_admission = Depends(admission('analytics'))
+ingestion_admission = Depends(admission('ingestion'))
+import_admission = Depends(admission('import'))
+
+
+def reserve_threads() -> None:
+    """
+    Make the threadpool large enough to run the admitted requests of every class at the same time.
+
+    The blocking work of the routes (database sessions, analytics, ingestion) runs in the threadpool; with
+    fewer threads than admitted requests, a busy class would still hold up the others waiting for a thread.
+    Must be called from the event loop (e.g. on startup).
+    """
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    admitted = sum(admission_class.concurrency for admission_class in CLASSES.values())
+    limiter.total_tokens = max(limiter.total_tokens, admitted)
@@ -0,0 +1,95 @@
+import calendar
+import numpy as np
+import pandas as pd
+
+# Month name -> month number ('January' -> 1)
+MONTH_NUMBERS = {name: number for number, name in enumerate(calendar.month_name) if name}
+
+# Season of each month number (meteorological seasons, northern hemisphere)
+SEASONS = ['Winter', 'Winter', 'Spring', 'Spring', 'Spring', 'Summer', 'Summer', 'Summer', 'Autumn', 'Autumn',
+           'Autumn', 'Winter']
+
+# Calendar dimension (one row per date) and the date key of its first row, replaced together
+_state = (None, 0)
+
+
+def date_keys(dates: pd.Series) -> np.ndarray:
+    """
+    Convert dates to integer date keys (days since 1970-01-01).
+
+    :param dates: A datetime Series.
+    :return: An int64 array of date keys.
+    """
+    return dates.to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def date_key(day) -> int:
+    """
+    Convert a single date to its integer date key.
+
+    :param day: A date or Timestamp.
+    :return: The date key (days since 1970-01-01).
+    """
+    return int(np.datetime64(day, 'D').astype(np.int64))
+
+
+def build_calendar(first: pd.Timestamp, last: pd.Timestamp) -> pd.DataFrame:
+    """
+    Build the calendar dimension for a period.
+
+    Every date gets its year, month, month name, weekday name, ISO week and season, so the analytics can look
+    these up by integer date key instead of formatting and parsing dates.
+
+    :param first: First date of the calendar.
+    :param last: Last date of the calendar.
+    :return: The calendar DataFrame, one row per date.
+    """
+    global _state
+
+    dates = pd.date_range(first.normalize(), last.normalize(), freq='D')
+    months = dates.month.to_numpy()
+
+    calendar_frame = pd.DataFrame({
+        'date_key': date_keys(pd.Series(dates)),
+        'date': dates,
+        'year': dates.year,
+        'month': months,
+        'month_name': np.array(calendar.month_name)[months],
+        'weekday': np.array(calendar.day_name)[dates.weekday.to_numpy()],
+        'iso_week': dates.isocalendar().week.to_numpy(),
+        'season': np.array(SEASONS)[months - 1],
+    })
+    first_key = int(calendar_frame['date_key'].iloc[0]) if len(calendar_frame) else 0
+    _state = (calendar_frame, first_key)
+
+    return calendar_frame
+
+
+def ensure_calendar(first: pd.Timestamp, last: pd.Timestamp) -> pd.DataFrame:
+    """
+    Make sure the calendar dimension covers a period, extending it if needed.
+
+    :param first: First date that must be in the calendar.
+    :param last: Last date that must be in the calendar.
+    :return: The calendar DataFrame.
+    """
+    calendar_frame, _ = _state
+    if calendar_frame is not None and len(calendar_frame):
+        covered_first, covered_last = calendar_frame['date'].iloc[0], calendar_frame['date'].iloc[-1]
+        if covered_first <= first.normalize() and last.normalize() <= covered_last:
+            return calendar_frame
+        first, last = min(first, covered_first), max(last, covered_last)
+
+    return build_calendar(first, last)
+
+
+def lookup(keys, attribute: str) -> np.ndarray:
+    """
+    Look up a calendar attribute for date keys.
+
+    :param keys: Date keys (array-like of ints) within the calendar.
+    :param attribute: Calendar column, e.g. 'year', 'month_name', 'weekday', 'iso_week' or 'season'.
+    :return: An array with the attribute of every key.
+    """
+    calendar_frame, first_key = _state
+    return calendar_frame[attribute].to_numpy()[np.asarray(keys) - first_key]
@@ -0,0 +1,449 @@
+import numpy as np
+import pandas as pd
+from config import settings
+from app.schemas import DateRange
+from app.sketches import SpaceSaving, TDigest
+from app import calendar_dim, dataset
+
+# Memory needed per chunk relative to the parsed size of its columns (derived columns, intermediate results)
+WORKING_SET_FACTOR = 4
+MIN_CHUNK_SIZE = 1000
+# Guest names tracked by the Space-Saving summary of `stats_calculation` (guest names are nearly unique, so
+# exact counts would grow with the number of rows)
+NAME_COUNTERS = 1000
+
+
+class ColumnMoments:
+    """
+    Mergeable summary of a numeric column for `describe`.
+
+    Count, mean, M2 (sum of squared deviations from the mean), minimum and maximum are merged exactly
+    (Chan's parallel algorithm); the quartiles come from a t-digest and are approximate, unless they are
+    passed to `describe`.
+    """
+
+    def __init__(self, values: pd.Series, digest: bool = True):
+        values = values.dropna().astype(np.float64)
+        self.count = len(values)
+        self.mean = float(values.mean()) if self.count else 0.0
+        self.m2 = float(((values - self.mean) ** 2).sum())
+        self.min = float(values.min()) if self.count else np.nan
+        self.max = float(values.max()) if self.count else np.nan
+        self.digest = TDigest().update(values) if digest else None
+
+    def merge(self, other: 'ColumnMoments') -> 'ColumnMoments':
+        count = self.count + other.count
+        if count:
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.mean += delta * other.count / count
+        self.count = count
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        if self.digest is not None:
+            self.digest.merge(other.digest)
+        return self
+
+    def describe(self, quartiles: list | None = None) -> dict:
+        if quartiles is None:
+            quartiles = [self.digest.quantile(q)['value'] for q in (0.25, 0.5, 0.75)]
+        quartiles = [None if value is None or np.isnan(value) else float(value) for value in quartiles]
+        return {
+            'count': float(self.count),
+            'mean': self.mean if self.count else None,
+            'std': (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else None,
+            'min': self.min if self.count else None,
+            '25%': quartiles[0],
+            '50%': quartiles[1],
+            '75%': quartiles[2],
+            'max': self.max if self.count else None,
+        }
+
+
+def merge_partials(left: dict, right: dict) -> dict:
+    """
+    Merge two partial aggregates of the same analytic.
+
+    Values with a `merge` method are merged with it, pandas objects are added with missing groups counted
+    as zero, and other values (numbers, lists) are combined with `+`.
+
+    :param left: Partial aggregate (updated in place).
+    :param right: Partial aggregate to merge into `left`.
+    :return: The merged partial aggregate.
+    """
+    for name, value in right.items():
+        if name not in left:
+            left[name] = value
+        elif hasattr(left[name], 'merge'):
+            left[name].merge(value)
+        elif isinstance(value, (pd.Series, pd.DataFrame)):
+            left[name] = left[name].add(value, fill_value=0)
+        else:
+            left[name] = left[name] + value
+    return left
+
+
+def rank_counts(counts: pd.Series) -> pd.Series:
+    """
+    Sort counts in descending order, equal counts by value, so the order does not depend on how the counts
+    were computed (in one pass, or merged from chunks or blocks).
+    """
+    return counts.sort_index(kind='stable').sort_values(ascending=False, kind='stable').astype('int64')
+
+
+def _stats_partial(chunk, exact=False):
+    return {
+        'rows': len(chunk),
+        'los_sum': float(chunk['length_of_stay'].sum()),
+        'los_count': int(chunk['length_of_stay'].count()),
+        'adr_sum': float(chunk['adr'].sum()),
+        'adr_count': int(chunk['adr'].count()),
+        'names': chunk['name'].value_counts() if exact else SpaceSaving(NAME_COUNTERS).update(chunk['name']),
+        'dates': chunk['booking_key'].value_counts(),
+    }
+
+
+def _exact_stats_partial(chunk):
+    return _stats_partial(chunk, exact=True)
+
+
+def _stats_final(partial, *args):
+    names = partial['names']
+    dates = rank_counts(partial['dates']).head(10).index.to_numpy()
+    return {
+        'number_of_bookings': partial['rows'],
+        'average_length_of_stay': partial['los_sum'] / partial['los_count'] if partial['los_count'] else None,
+        'average_daily_rate': partial['adr_sum'] / partial['adr_count'] if partial['adr_count'] else None,
+        'ten_most_common_guests': (rank_counts(names).head(10).index.to_list() if isinstance(names, pd.Series)
+                                   else [entry['value'] for entry in names.top(10)]),
+        'ten_most_popular_dates': pd.DatetimeIndex(calendar_dim.lookup(dates, 'date')).strftime('%Y-%m-%d').to_list()
+    }
+
+
+def _analysis_partial(chunk, digest=True):
+    raw = chunk.drop(columns=dataset.DERIVED_COLUMNS)
+    partial = {
+        'months': chunk['arrival_date_month'].value_counts(),
+        'meals': chunk['meal'].value_counts(),
+        'countries': chunk['country'].value_counts(),
+    }
+    for column in raw.select_dtypes('number').columns:
+        partial[f'describe:{column}'] = ColumnMoments(raw[column], digest)
+    return partial
+
+
+def _exact_analysis_partial(chunk):
+    return _analysis_partial(chunk, digest=False)
+
+
+def _analysis_final(partial, *args, quartiles: pd.DataFrame | None = None):
+    moments = {name.split(':', 1)[1]: value for name, value in partial.items() if name.startswith('describe:')}
+    return {
+        'booking_trends_by_month': rank_counts(partial['months']).to_dict(),
+        'meal_packages_trends': rank_counts(partial['meals']).to_dict(),
+        'guest_demographics': rank_counts(partial['countries']).to_dict(),
+        'analysis': {column: value.describe(None if quartiles is None else quartiles[column].to_list())
+                     for column, value in moments.items()}
+    }
+
+
+def _exact_analysis_final(partial, date_range=None):
+    # The dataset is in memory: the quartiles are computed from the selected rows, as in 'memory' mode
+    quartiles = dataset.select(date_range, [column.split(':', 1)[1] for column in partial
+                                            if column.startswith('describe:')]).quantile([0.25, 0.5, 0.75])
+    return _analysis_final(partial, quartiles=quartiles)
+
+
+def _nationality_partial(chunk, country):
+    return {'bookings': [chunk[chunk['country'] == country]]}
+
+
+def _nationality_final(partial, country):
+    return dataset.to_booking_records(pd.concat(partial['bookings']).sort_values('id'))
+
+
+def _meal_partial(chunk):
+    return {'meals': chunk['meal'].value_counts()}
+
+
+def _meal_final(partial, *args):
+    result = rank_counts(partial['meals']).head(1)
+    if result.empty:
+        return {"Top meal": None, "Frequency": 0}
+    return {"Top meal": str(result.index[0]), "Frequency": int(result.iloc[0])}
+
+
+def _avg_length_of_stay_partial(chunk):
+    grouped = chunk.assign(booking_date_year=calendar_dim.lookup(chunk['booking_key'], 'year')).groupby(
+        ['booking_date_year', 'hotel'])['length_of_stay']
+    return {'sum': grouped.sum(), 'count': grouped.count()}
+
+
+def _avg_length_of_stay_final(partial, *args):
+    result = (partial['sum'] / partial['count']).sort_index().rename('length_of_stay')
+    return result.reset_index().to_dict(orient='records')
+
+
+def _total_revenue_partial(chunk):
+    chunk = chunk[chunk['is_canceled'] == 0]
+    revenue = chunk.assign(booking_date_month=calendar_dim.lookup(chunk['booking_key'], 'month_name'),
+                           revenue=chunk['adr'] * chunk['length_of_stay'])
+    return {'revenue': revenue.groupby(['booking_date_month', 'hotel'])['revenue'].sum()}
+
+
+def _total_revenue_final(partial, *args):
+    return partial['revenue'].sort_index().reset_index().to_dict(orient='records')
+
+
+def _countries_partial(chunk):
+    return {'countries': chunk['country'].value_counts()}
+
+
+def _countries_final(partial, *args):
+    return rank_counts(partial['countries']).head(5).to_dict()
+
+
+def _repeated_guests_partial(chunk):
+    return {'rows': len(chunk), 'repeated': int((chunk['is_repeated_guest'] == 1).sum())}
+
+
+def _repeated_guests_final(partial, *args):
+    return {
+        'all_bookings': partial['rows'],
+        'repeated_guests': partial['repeated'],
+        'percentage_of_repeated_guests': partial['repeated'] / partial['rows'] * 100 if partial['rows'] else 0.0
+    }
+
+
+def _guests_by_year_partial(chunk):
+    guests = chunk.assign(booking_date_year=calendar_dim.lookup(chunk['booking_key'], 'year'),
+                          total_guests=chunk[['adults', 'children', 'babies']].sum(axis=1))
+    return {'guests': guests.groupby('booking_date_year')['total_guests'].sum()}
+
+
+def _guests_by_year_final(partial, *args):
+    return partial['guests'].sort_index().reset_index().to_dict(orient='records')
+
+
+def _avg_daily_rate_resort_partial(chunk):
+    resort = chunk[chunk['hotel'] == 'Resort Hotel'].rename(columns={'arrival_date_month': 'month'})
+    return {'adr': resort.groupby('month')['adr'].agg(['sum', 'count'])}
+
+
+def _avg_daily_rate_resort_final(partial, *args):
+    result = (partial['adr']['sum'] / partial['adr']['count']).sort_index().rename('adr')
+    return result.reset_index().to_dict(orient='records')
+
+
+def _arrival_day_partial(chunk):
+    city = chunk[chunk['hotel'] == 'City Hotel']
+    return {'days': pd.Series(calendar_dim.lookup(city['arrival_key'], 'weekday')).value_counts()}
+
+
+def _arrival_day_final(partial, *args):
+    result = rank_counts(partial['days']).head(1).rename_axis('most_common_arrival_day').rename('count')
+    return result.reset_index().to_dict(orient='records')
+
+
+def _hotel_meal_partial(chunk):
+    return {'counts': chunk.groupby(['hotel', 'meal']).size()}
+
+
+def _hotel_meal_final(partial, *args):
+    result = partial['counts'].astype('int64').sort_index().reset_index(name='count')
+    return result.sort_values(by='count', ascending=False).to_dict(orient='records')
+
+
+def _revenue_by_country_partial(chunk):
+    resort = chunk[(chunk['is_canceled'] == 0) & (chunk['hotel'] == 'Resort Hotel')]
+    revenue = resort.assign(total_revenue=resort['adr'] * resort['length_of_stay'])
+    return {'revenue': revenue.groupby('country')['total_revenue'].sum()}
+
+
+def _revenue_by_country_final(partial, *args):
+    result = partial['revenue'].sort_index().reset_index()
+    return result.sort_values(by='total_revenue', ascending=False).to_dict(orient='records')
+
+
+def _repeated_by_hotel_partial(chunk):
+    return {'counts': chunk.groupby(['hotel', 'is_repeated_guest']).size()}
+
+
+def _repeated_by_hotel_final(partial, *args):
+    result = partial['counts'].astype('int64').sort_index().reset_index(name='count')
+    result['is_repeated_guest'] = result['is_repeated_guest'].replace({0: 'not_repeated', 1: 'repeated'})
+    return result.to_dict(orient='records')
+
+
+def _occupancy_partial(chunk, date_range=None):
+    chunk = chunk[chunk['is_canceled'] == 0]
+    arrivals = pd.DataFrame({'hotel': chunk['hotel'], 'key': chunk['arrival_key'], 'rooms': 1,
+                             'revenue': chunk['adr']})
+    departures = pd.DataFrame({'hotel': chunk['hotel'], 'key': chunk['arrival_key'] + chunk['length_of_stay'],
+                               'rooms': -1, 'revenue': -chunk['adr']})
+    return {'changes': pd.concat([arrivals, departures]).groupby(['hotel', 'key'])[['rooms', 'revenue']].sum()}
+
+
+def _occupancy_final(partial, date_range=None):
+    changes = partial.get('changes')
+    if changes is None or changes.empty:
+        return []
+
+    keys = changes.index.get_level_values('key')
+    all_keys = np.arange(int(keys.min()), int(keys.max()) + 1)
+    first, last = all_keys[0], all_keys[-1]
+    if date_range is not None and date_range.date_from is not None:
+        first = max(first, calendar_dim.date_key(date_range.date_from))
+    if date_range is not None and date_range.date_to is not None:
+        last = min(last, calendar_dim.date_key(date_range.date_to))
+
+    result = []
+    for hotel, hotel_changes in changes.groupby(level='hotel'):
+        totals = hotel_changes.droplevel('hotel').reindex(all_keys, fill_value=0).cumsum()
+        totals = totals.loc[first:last]
+        nights = pd.DatetimeIndex(calendar_dim.lookup(totals.index, 'date')).strftime('%Y-%m-%d')
+        result.extend({
+            'hotel': hotel,
+            'date': night,
+            'occupied_rooms': int(rooms),
+            'revenue': round(float(revenue), 2)
+        } for night, rooms, revenue in zip(nights, totals['rooms'], totals['revenue']))
+
+    return result
+
+
+# Analytic name -> (csv columns it reads besides `dataset.SOURCE_COLUMNS` (None: all), partial function,
+# final function, whether the date range filters the rows)
+ANALYTICS = {
+    'stats_calculation': (['name', 'adr'], _stats_partial, _stats_final, True),
+    'analysis_calculation': (None, _analysis_partial, _analysis_final, True),
+    'filtering_by_nationality': (['name', 'adr', 'country'], _nationality_partial, _nationality_final, False),
+    'popular_meal_package': (['meal'], _meal_partial, _meal_final, True),
+    'avg_length_of_stay': (['hotel'], _avg_length_of_stay_partial, _avg_length_of_stay_final, True),
+    'total_revenue': (['adr', 'is_canceled', 'hotel'], _total_revenue_partial, _total_revenue_final, True),
+    'top_countries': (['country'], _countries_partial, _countries_final, True),
+    'repeated_guests_percentages': (['is_repeated_guest'], _repeated_guests_partial, _repeated_guests_final, True),
+    'total_guests_by_year': (['adults', 'children', 'babies'], _guests_by_year_partial, _guests_by_year_final,
+                             True),
+    'avg_daily_rate_resort': (['hotel', 'adr'], _avg_daily_rate_resort_partial, _avg_daily_rate_resort_final,
+                              True),
+    'most_common_arrival_day_city': (['hotel'], _arrival_day_partial, _arrival_day_final, True),
+    'count_by_hotel_meal': (['hotel', 'meal'], _hotel_meal_partial, _hotel_meal_final, True),
+    'total_revenue_resort_by_country': (['adr', 'is_canceled', 'hotel', 'country'], _revenue_by_country_partial,
+                                        _revenue_by_country_final, True),
+    'count_by_hotel_repeated_guest': (['hotel', 'is_repeated_guest'], _repeated_by_hotel_partial,
+                                      _repeated_by_hotel_final, True),
+    'nightly_occupancy': (['hotel', 'adr', 'is_canceled'], _occupancy_partial, _occupancy_final, False),
+}
+
+
+# Analytic name -> (partial function, final function) used instead of the ones of `ANALYTICS` when the whole
+# dataset is in memory ('parallel' mode): exact name counts instead of the Space-Saving summary, and
+# quartiles computed from the selected rows instead of t-digest estimates
+EXACT_ANALYTICS = {
+    'stats_calculation': (_exact_stats_partial, _stats_final),
+    'analysis_calculation': (_exact_analysis_partial, _exact_analysis_final),
+}
+
+
+def chunk_size(columns: list | None) -> int:
+    """
+    Choose the number of csv rows per chunk so that a chunk fits the configured memory ceiling.
+
+    The parsed size of a row is measured on a sample of the file and multiplied by `WORKING_SET_FACTOR`.
+
+    :param columns: The csv columns that are read (None: all).
+    :return: Number of rows per chunk.
+    """
+    sample = pd.read_csv(dataset.DATA_PATH, usecols=columns, nrows=MIN_CHUNK_SIZE)
+    bytes_per_row = sample.memory_usage(deep=True).sum() / max(len(sample), 1)
+    limit = settings.ANALYTICS_MEMORY_LIMIT_MB * 2 ** 20
+    return max(MIN_CHUNK_SIZE, int(limit / (bytes_per_row * WORKING_SET_FACTOR)))
+
+
+def _usecols(columns: list | None) -> list | None:
+    return None if columns is None else list(dict.fromkeys(dataset.SOURCE_COLUMNS + columns))
+
+
+def read_chunks(columns: list | None = None):
+    """
+    Read the saved csv file chunk by chunk, with the derived columns added to every chunk.
+
+    :param columns: The csv columns to read besides `dataset.SOURCE_COLUMNS` (None: all).
+    :return: An iterator over DataFrames.
+    """
+    usecols = _usecols(columns)
+    for chunk in pd.read_csv(dataset.DATA_PATH, usecols=usecols, chunksize=chunk_size(usecols)):
+        yield dataset.derive_columns(chunk)
+
+
+def _filter_rows(chunk: pd.DataFrame, date_range: DateRange) -> pd.DataFrame:
+    keys = chunk['booking_key' if date_range.field == 'booking' else 'arrival_key']
+    mask = np.ones(len(chunk), dtype=bool)
+    if date_range.date_from is not None:
+        mask &= keys.to_numpy() >= calendar_dim.date_key(date_range.date_from)
+    if date_range.date_to is not None:
+        mask &= keys.to_numpy() <= calendar_dim.date_key(date_range.date_to)
+    return chunk[mask]
+
+
+def partial_aggregate(name: str, chunk: pd.DataFrame, *args, exact: bool = False) -> dict:
+    """
+    Compute the partial aggregate of an analytic over some rows of the dataset.
+
+    :param name: Name of the analytic (a key of `ANALYTICS`).
+    :param chunk: Rows of the dataset, with the derived columns.
+    :param args: Arguments of the analytic; for analytics filtered by date the first one is the `DateRange`.
+    :param exact: Use the exact aggregates of `EXACT_ANALYTICS` (the dataset must be in memory).
+    :return: The partial aggregate.
+    """
+    _, partial, _, filter_rows = ANALYTICS[name]
+    if exact and name in EXACT_ANALYTICS:
+        partial = EXACT_ANALYTICS[name][0]
+    if not filter_rows:
+        return partial(chunk, *args)
+
+    date_range, args = (args[0], args[1:]) if args else (None, ())
+    if date_range is not None:
+        chunk = _filter_rows(chunk, date_range)
+    return partial(chunk, *args)
+
+
+def finalize(name: str, partial: dict, *args, exact: bool = False):
+    """
+    Turn the merged partial aggregate of an analytic into its result.
+
+    :param name: Name of the analytic (a key of `ANALYTICS`).
+    :param partial: Merged partial aggregate of all rows.
+    :param args: Arguments of the analytic.
+    :param exact: The partial aggregate was computed with `exact=True` (see `partial_aggregate`).
+    :return: The result, in the same format as the in-memory analytic.
+    """
+    _, _, final, _ = ANALYTICS[name]
+    if exact and name in EXACT_ANALYTICS:
+        final = EXACT_ANALYTICS[name][1]
+    return final(partial, *args)
+
+
+def compute(name: str, *args):
+    """
+    Compute an analytic out of core.
+
+    The saved csv file is streamed in chunks sized for `ANALYTICS_MEMORY_LIMIT_MB`; only the partial
+    aggregates (counts, sums, moments per group, bounded summaries of the most common guest names) are kept
+    between chunks.
+
+    :param name: Name of the analytic (a key of `ANALYTICS`).
+    :param args: Arguments of the analytic.
+    :return: The result, in the same format as the in-memory analytic.
+    """
+    columns = ANALYTICS[name][0]
+    partial = {}
+    for chunk in read_chunks(columns):
+        merge_partials(partial, partial_aggregate(name, chunk, *args))
+    if not partial:
+        # No rows: aggregate an empty chunk
+        empty = pd.read_csv(dataset.DATA_PATH, usecols=_usecols(columns), nrows=0)
+        partial = partial_aggregate(name, dataset.derive_columns(empty), *args)
+    return finalize(name, partial, *args)
+
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+from app import calendar_dim, dataset
+from app.schemas import CubeQuery
+
+# Dimensions of the cube; year and month are those of the arrival date
+DIMENSIONS = ['year', 'month', 'hotel', 'country', 'meal', 'is_repeated_guest', 'is_canceled']
+MEASURES = ['bookings', 'nights', 'revenue', 'guests']
+# Dataset columns the cube is built from
+CUBE_COLUMNS = ['arrival_key', 'hotel', 'country', 'meal', 'is_repeated_guest', 'is_canceled', 'length_of_stay',
+                'adr', 'adults', 'children', 'babies']
+
+# Dataset the cube was built for and the cube itself
+_source = None
+_cube = None
+
+
+def build_cube(columns: dataset.LazyColumns) -> pd.DataFrame:
+    """
+    Build the booking cube: the measures of the bookings aggregated for every combination of dimension values
+    that occurs in the dataset.
+
+    Measures:
+    - 'bookings': number of bookings.
+    - 'nights': sum of the lengths of stay.
+    - 'revenue': sum of daily rate times length of stay.
+    - 'guests': sum of adults, children and babies.
+
+    :param columns: The columns of the booking dataset (see `dataset.store`); only the `CUBE_COLUMNS` are read.
+    :return: The cube, one row per combination of dimension values.
+    """
+    global _source, _cube
+
+    frame = columns.frame(CUBE_COLUMNS)
+
+    facts = pd.DataFrame({
+        'year': calendar_dim.lookup(frame['arrival_key'], 'year'),
+        'month': calendar_dim.lookup(frame['arrival_key'], 'month'),
+        'hotel': frame['hotel'].to_numpy(),
+        'country': frame['country'].to_numpy(),
+        'meal': frame['meal'].to_numpy(),
+        'is_repeated_guest': frame['is_repeated_guest'].to_numpy(),
+        'is_canceled': frame['is_canceled'].to_numpy(),
+        'bookings': np.ones(len(frame), dtype=np.int64),
+        'nights': frame['length_of_stay'].to_numpy(),
+        'revenue': (frame['adr'] * frame['length_of_stay']).to_numpy(),
+        'guests': frame[['adults', 'children', 'babies']].sum(axis=1).to_numpy(),
+    })
+    cube = facts.groupby(DIMENSIONS, dropna=False, sort=True)[MEASURES].sum().reset_index()
+    # Missing dimension values (e.g. unknown country) are kept as their own cell and reported as null
+    cube = cube.astype({'country': object, 'meal': object, 'hotel': object})
+    cube[['hotel', 'country', 'meal']] = cube[['hotel', 'country', 'meal']].where(
+        cube[['hotel', 'country', 'meal']].notna(), None)
+
+    _cube = cube
+    _source = columns
+    return cube
+
+
+def _ensure_cube() -> pd.DataFrame:
+    columns = dataset.store()
+    if _source is not columns:
+        build_cube(columns)
+    return _cube
+
+
+def query_cube(query: CubeQuery) -> list:
+    """
+    Answer a roll-up, slice or dice query from the booking cube.
+
+    The cells matching the filters (slice: one value of a dimension, dice: several values of several
+    dimensions) are summed up per combination of the `group_by` dimensions (roll-up over the others).
+    The cost depends on the number of cells of the cube, not on the number of bookings.
+
+    :param query: The dimensions to group by and the dimension values to keep.
+    :return: A list of dictionaries with the `group_by` dimensions and the measures (a single dictionary
+        with the measures over all matching bookings when `group_by` is empty).
+    """
+    cube = _ensure_cube()
+
+    mask = np.ones(len(cube), dtype=bool)
+    for dimension in DIMENSIONS:
+        values = getattr(query, dimension)
+        if values is not None:
+            mask &= cube[dimension].isin(values).to_numpy()
+    selected = cube[mask]
+
+    if not query.group_by:
+        return [{measure: selected[measure].sum().item() for measure in MEASURES}]
+
+    keys = list(query.group_by)
+    result = selected.groupby(keys, dropna=False, sort=True)[MEASURES].sum().reset_index()
+    # The regrouping turns the null dimension values of the cube back into NaN
+    result = result.astype({key: object for key in keys})
+    result[keys] = result[keys].where(result[keys].notna(), None)
+    return result.to_dict(orient='records')
@@ -0,0 +1,355 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+import numpy as np
+import pandas as pd
+from app import calendar_dim
+
+# Retained copy of the uploaded csv file (see startup.save_upload); pandas decompresses it by its suffix
+DATA_PATH = 'app/data/hotel_booking_data.csv.gz'
+
+# Booking dataset held in memory, replaced as a whole: the columns (see `LazyColumns`) of the rows sorted by
+# arrival date, the columns of the uploaded csv file (without derived columns), the positions of the rows
+# ordered by booking date and the booking dates in that order
+_state = None
+# Dataset state used instead of `_state` in the current context (see `using`)
+_override = ContextVar('dataset_override', default=None)
+
+# Columns added by `derive_columns`
+DERIVED_COLUMNS = ['id', 'arrival_date', 'booking_date', 'length_of_stay', 'arrival_key', 'booking_key']
+# Largest booking id (see `booking_ids`): the largest integer a JavaScript number holds exactly
+MAX_BOOKING_ID = 2 ** 53 - 1
+# Columns of the csv file the derived columns are computed from
+SOURCE_COLUMNS = ['arrival_date_year', 'arrival_date_month', 'arrival_date_day_of_month', 'lead_time',
+                  'stays_in_weekend_nights', 'stays_in_week_nights', 'name', 'adr']
+
+
+class LazyColumns:
+    """
+    Columns of the booking dataset, loaded when they are first used.
+
+    A column source is either an array (possibly memory-mapped) or, for text columns, a pair of category
+    codes and categories that is only decoded for the rows asked for. Reading a few columns of a few rows
+    therefore costs in proportion to what is read, not to the width of the dataset.
+    """
+
+    def __init__(self, length: int, sources: dict, frame: pd.DataFrame | None = None):
+        """
+        :param length: Number of rows.
+        :param sources: Column name -> array, or (codes, categories) pair (code -1 for missing values picks
+            the last category, which should be NaN).
+        :param frame: The DataFrame of all columns, if it is already built.
+        """
+        self.length = length
+        self.names = list(sources)
+        self._sources = dict(sources)
+        self._frame = frame
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> 'LazyColumns':
+        return cls(len(frame), {name: frame[name].to_numpy() for name in frame.columns}, frame)
+
+    def column(self, name: str, rows=None) -> np.ndarray:
+        """
+        Return the values of a column.
+
+        :param name: Column name.
+        :param rows: Optional row positions (a slice or an integer array); all rows by default.
+        """
+        source = self._sources[name]
+        if isinstance(source, tuple):
+            codes, categories = source
+            if rows is not None:
+                return categories[codes[rows]]
+            with self._lock:
+                if isinstance(self._sources[name], tuple):
+                    self._sources[name] = categories[codes]
+                source = self._sources[name]
+        return source if rows is None else source[rows]
+
+    def equals(self, name: str, value, rows=None) -> np.ndarray:
+        """
+        Compare a column with a value, without decoding text columns.
+
+        :return: A boolean array, one value per row (of `rows` if given).
+        """
+        source = self._sources[name]
+        if isinstance(source, tuple):
+            codes, categories = source
+            matches = np.flatnonzero(categories == value)
+            codes = codes if rows is None else codes[rows]
+            return codes == (matches[0] if len(matches) else -2)
+        return self.column(name, rows) == value
+
+    def frame(self, names: list | None = None, rows=None) -> pd.DataFrame:
+        """
+        Build a DataFrame of some columns and rows.
+
+        :param names: Column names (all columns by default).
+        :param rows: Optional row positions (a slice or an integer array); all rows by default. The index of
+            the result holds the row positions.
+        """
+        if names is None and rows is None:
+            return self.full()
+
+        index = pd.RangeIndex(self.length)
+        if rows is not None:
+            index = index[rows]
+        names = self.names if names is None else names
+        return pd.DataFrame({name: self.column(name, rows) for name in names}, index=index, copy=False)
+
+    def full(self) -> pd.DataFrame:
+        """
+        Return the DataFrame of all columns and rows (always the same object).
+        """
+        with self._lock:
+            if self._frame is None:
+                self._frame = pd.DataFrame({name: self.column(name) for name in self.names}, copy=False)
+            return self._frame
+
+
+def booking_ids(booking_date: pd.Series, length_of_stay: pd.Series, name: pd.Series, adr: pd.Series) -> np.ndarray:
+    """
+    Derive the booking ids from the values stored in the bookings table.
+
+    The id is a 53-bit hash of the booking date, length of stay, guest name and daily rate, and of the number
+    of earlier rows with the same values. Unlike the row position in the csv file, it does not change when
+    other rows are added to or removed from the file, so only the partitions of the bookings table that hold
+    changed rows have to be reloaded (see `startup.save_partitions`). 53 bits keep the ids exact as numbers
+    in JavaScript clients.
+
+    :return: The ids, in the order of the rows.
+    """
+    values = pd.DataFrame({
+        'booking_date': pd.to_datetime(booking_date).to_numpy(),
+        'length_of_stay': length_of_stay.to_numpy(dtype=np.float64),
+        'name': name.astype(str).to_numpy(),
+        'adr': adr.to_numpy(dtype=np.float64),
+    })
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    occurrences = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    keys = pd.util.hash_pandas_object(pd.DataFrame({'hash': hashes, 'occurrence': occurrences}), index=False)
+    return (keys.to_numpy() & np.uint64(MAX_BOOKING_ID)).astype(np.int64)
+
+
+def derive_columns(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add the derived columns to rows of the csv file.
+
+    Adds 'arrival_date', 'booking_date', 'length_of_stay', 'id' (see `booking_ids`) and the integer date keys
+    'arrival_key' and 'booking_key', and extends the calendar dimension to cover the dates.
+
+    In 'chunked' mode the rows come a chunk at a time, so identical rows in different chunks get the same id.
+
+    :param frame: Rows of the csv file, with at least the `SOURCE_COLUMNS`.
+    :return: The same DataFrame with the derived columns.
+    """
+    frame['arrival_date'] = pd.to_datetime(pd.DataFrame({
+        'year': frame['arrival_date_year'],
+        'month': frame['arrival_date_month'].map(calendar_dim.MONTH_NUMBERS),
+        'day': frame['arrival_date_day_of_month'],
+    }))
+    frame['booking_date'] = frame['arrival_date'] - pd.to_timedelta(frame['lead_time'], unit='D')
+    frame['length_of_stay'] = frame['stays_in_weekend_nights'] + frame['stays_in_week_nights']
+    frame['id'] = booking_ids(frame['booking_date'], frame['length_of_stay'], frame['name'], frame['adr'])
+    frame['arrival_key'] = calendar_dim.date_keys(frame['arrival_date'])
+    frame['booking_key'] = calendar_dim.date_keys(frame['booking_date'])
+
+    if len(frame):
+        departure = frame['arrival_date'] + pd.to_timedelta(frame['length_of_stay'], unit='D')
+        calendar_dim.ensure_calendar(frame['booking_date'].min(), departure.max())
+
+    return frame
+
+
+def prepare_dataset(df: pd.DataFrame) -> tuple:
+    """
+    Build a booking dataset from the uploaded DataFrame, without installing it as the in-memory dataset.
+
+    Derives 'id', 'arrival_date', 'booking_date' and 'length_of_stay' columns (the same values that are
+    written to the bookings table) and the integer date keys (see `derive_columns`), sorts the rows by arrival
+    date and keeps a second ordering by booking date, so a date range can be resolved with binary search
+    instead of a boolean mask over all rows.
+
+    :param df: A pandas DataFrame with the raw csv data.
+    :return: The dataset state, to be passed to `install_dataset` or `using`.
+    """
+    frame = derive_columns(df.copy())
+    frame = frame.sort_values('arrival_date', kind='stable').reset_index(drop=True)
+
+    booking_order = np.argsort(frame['booking_date'].to_numpy(), kind='stable')
+    return (LazyColumns.from_frame(frame), list(df.columns), booking_order,
+            frame['booking_date'].to_numpy()[booking_order])
+
+
+def install_dataset(state: tuple) -> pd.DataFrame:
+    """
+    Install a dataset state (see `prepare_dataset`) as the in-memory dataset, in a single step.
+
+    :return: The dataset sorted by arrival date.
+    """
+    global _state
+
+    _state = state
+    return state[0].full()
+
+
+def build_dataset(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Build the in-memory booking dataset from the uploaded DataFrame (see `prepare_dataset`).
+
+    :param df: A pandas DataFrame with the raw csv data.
+    :return: The dataset sorted by arrival date.
+    """
+    return install_dataset(prepare_dataset(df))
+
+
+@contextmanager
+def using(state: tuple):
+    """
+    Serve a dataset state (see `prepare_dataset`) instead of the in-memory dataset in the current context,
+    e.g. to compute results for a dataset before it is installed.
+    """
+    token = _override.set(state)
+    try:
+        yield state[0].full()
+    finally:
+        _override.reset(token)
+
+
+def _current() -> tuple:
+    state = _override.get() or _state
+    if state is None:
+        # Imported here, the snapshots module depends on this one
+        from app import snapshots
+
+        entry = snapshots.current_snapshot()
+        if entry is not None and entry['columns'] is not None:
+            snapshots.load_snapshot(entry)
+        else:
+            build_dataset(pd.read_csv(DATA_PATH))
+        state = _state
+    return state
+
+
+def get_dataset() -> pd.DataFrame:
+    """
+    Return the in-memory booking dataset, loading the current snapshot or building it from the saved csv file
+    if needed.
+
+    :return: The dataset sorted by arrival date.
+    """
+    return _current()[0].full()
+
+
+def store() -> LazyColumns:
+    """
+    Return the columns of the dataset (see `LazyColumns`), without loading them.
+
+    The structures built from the dataset (cube, sample, sketches, name index) compare it by identity to
+    tell whether the dataset was replaced, and read only the columns they need from it.
+    """
+    return _current()[0]
+
+
+def row_count() -> int:
+    """
+    Return the number of rows of the dataset, without loading its columns.
+    """
+    return _current()[0].length
+
+
+def restore_dataset(columns: LazyColumns, raw_columns: list, booking_order: np.ndarray) -> None:
+    """
+    Install an already built dataset (e.g. loaded from a snapshot) as the in-memory dataset.
+
+    Only the date columns are read; the other columns are loaded when they are first used.
+
+    :param columns: The columns of the dataset, sorted by arrival date, with the derived columns.
+    :param raw_columns: The column names of the csv file it was built from.
+    :param booking_order: Positions of the rows ordered by booking date.
+    """
+    global _state
+
+    booking_dates = columns.column('booking_date')
+    if columns.length:
+        departure = (columns.column('arrival_date')
+                     + columns.column('length_of_stay').astype('timedelta64[D]')).max()
+        calendar_dim.ensure_calendar(pd.Timestamp(booking_dates.min()), pd.Timestamp(departure))
+
+    _state = (columns, list(raw_columns), booking_order, booking_dates[booking_order])
+
+
+def booking_order() -> np.ndarray:
+    """
+    Return the positions of the dataset rows ordered by booking date.
+    """
+    return _current()[2]
+
+
+def raw_columns() -> list:
+    """
+    Return the column names of the uploaded csv file.
+
+    :return: A list of column names without the derived columns.
+    """
+    return _current()[1]
+
+
+def select(date_range=None, columns: list | None = None, filters: dict | None = None) -> pd.DataFrame:
+    """
+    Select the rows of the dataset falling into a date range and matching equality filters.
+
+    The range bounds are located with `searchsorted` on the sorted date column, so the range is a contiguous
+    slice of the arrival-date ordering (or of the booking-date ordering) instead of a full boolean mask.
+    The filters are evaluated on that range only, and only the requested columns of the remaining rows
+    are loaded (see `LazyColumns`).
+
+    :param date_range: An optional `DateRange` with inclusive 'date_from' / 'date_to' bounds and the 'field'
+        ('arrival' or 'booking') the bounds apply to.
+    :param columns: Optional list of columns to return.
+    :param filters: Optional column name -> value; only rows where every column equals its value are kept.
+    :return: A DataFrame with the selected rows.
+    """
+    store, _, booking_order, booking_dates = _current()
+    rows = None
+
+    if date_range is not None and (date_range.date_from is not None or date_range.date_to is not None):
+        if date_range.field == 'booking':
+            values = booking_dates
+        else:
+            values = store.column('arrival_date')
+
+        start, stop = 0, len(values)
+        if date_range.date_from is not None:
+            start = np.searchsorted(values, np.datetime64(date_range.date_from, 'ns'), side='left')
+        if date_range.date_to is not None:
+            stop = np.searchsorted(values, np.datetime64(date_range.date_to, 'ns'), side='right')
+
+        if date_range.field == 'booking':
+            rows = np.sort(booking_order[start:stop])
+        else:
+            rows = slice(start, stop)
+
+    for name, value in (filters or {}).items():
+        matches = store.equals(name, value, rows)
+        if rows is None:
+            rows = np.flatnonzero(matches)
+        elif isinstance(rows, slice):
+            rows = rows.start + np.flatnonzero(matches)
+        else:
+            rows = rows[matches]
+
+    return store.frame(columns, rows)
+
+
+def to_booking_records(frame: pd.DataFrame) -> list:
+    """
+    Convert dataset rows to booking records.
+
+    :param frame: Rows of the booking dataset.
+    :return: A list of dictionaries with the same keys as `BookingModel`.
+    """
+    bookings = frame.rename(columns={'name': 'guest_name', 'adr': 'daily_rate'})
+    return bookings[['id', 'booking_date', 'length_of_stay', 'guest_name', 'daily_rate']].to_dict(orient='records')
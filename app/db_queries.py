@@ -1,27 +1,61 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from . import models, schemas
 
 
+def booking_rows():
+    """
+    Select the columns of `BookingModel` from the bookings table as plain row tuples.
+
+    Rows are not loaded into ORM objects (no identity map or attribute instrumentation), which is most of
+    the cost of reading large pages of bookings.
+    """
+    return select(models.Booking.id, models.Booking.guest_name, models.Booking.booking_date,
+                  models.Booking.length_of_stay, models.Booking.daily_rate)
+
+
 def get_bookings(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Booking).offset(skip).limit(limit).all()
+    return db.execute(booking_rows().offset(skip).limit(limit)).all()
 
 
-def search_booking(db: Session, guest_name: str, book_date: str, length_of_stay: int):
-    query = db.query(models.Booking)
+def booking_filters(guest_name: str, book_date: str, length_of_stay: int) -> list:
+    filters = []
 
     if guest_name:
-        query = query.filter(models.Booking.guest_name == guest_name)
+        filters.append(models.Booking.guest_name == guest_name)
 
     if book_date:
-        query = query.filter(models.Booking.booking_date == book_date)
+        filters.append(models.Booking.booking_date == book_date)
 
     if length_of_stay is not None:
-        query = query.filter(models.Booking.length_of_stay == length_of_stay)
+        filters.append(models.Booking.length_of_stay == length_of_stay)
 
-    results = query.all()
+    return filters
+
+
+def search_booking(db: Session, guest_name: str, book_date: str, length_of_stay: int):
+    query = booking_rows().where(*booking_filters(guest_name, book_date, length_of_stay))
+
+    results = db.execute(query).all()
 
     return results
 
 
+def stream_bookings(db: Session, guest_name: str = None, book_date: str = None, length_of_stay: int = None,
+                    batch_size: int = 10000):
+    """
+    Stream booking rows from a server-side cursor.
+
+    Selects plain column tuples (no ORM objects) filtered like `search_booking`, fetching `batch_size` rows
+    from the database at a time.
+
+    Returns an iterator over lists of at most `batch_size` rows.
+    """
+    query = booking_rows().where(*booking_filters(guest_name, book_date, length_of_stay)).order_by(models.Booking.id)
+
+    result = db.execute(query.execution_options(yield_per=batch_size))
+    return result.partitions()
+
+
 def get_booking_by_id(db: Session, booking_id: int):
-    return db.query(models.Booking).filter(models.Booking.id == booking_id).first()
+    return db.execute(booking_rows().where(models.Booking.id == booking_id)).first()
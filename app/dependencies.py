@@ -1,12 +1,15 @@
-from datetime import datetime
-from config import settings
-# from database import SQLALCHEMY_DATABASE_URL
+import numpy as np
 import pandas as pd
+from app.schemas import DateRange
+from app.execution import execution_mode
+from app.chunked import rank_counts
+from app import calendar_dim, dataset
 
 
-def stats_calculation() -> dict:
+@execution_mode
+def stats_calculation(date_range: DateRange | None = None) -> dict:
     """
-    Calculate statistics based on the data in the DataFrame `new_df`.
+    Calculate statistics based on the booking dataset.
 
     Returns a dictionary containing the following statistics:
 
@@ -16,14 +19,27 @@ def stats_calculation() -> dict:
     - 'ten_most_common_quests': List of ten most common guest names.
     - 'ten_most_popular_dates': List of ten most popular booking dates.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns a dictionary with calculated statistics.
     """
-    new_df = pd.read_sql_table('bookings', settings.DATABASE_URL_psycopg)
+    new_df = dataset.select(date_range, ['booking_date', 'length_of_stay', 'name', 'adr'])
     number_of_bookings = len(new_df)
+    if not number_of_bookings:
+        return {
+            'number_of_bookings': 0,
+            'average_length_of_stay': None,
+            'average_daily_rate': None,
+            'ten_most_common_guests': [],
+            'ten_most_popular_dates': []
+        }
     average_length_of_stay = new_df['length_of_stay'].mean()
-    average_daily_rate = new_df['daily_rate'].mean()
-    ten_most_common_guests = new_df['guest_name'].value_counts().head(10).index.to_list()
-    ten_most_popular_dates = new_df['booking_date'].value_counts().head(10).index.to_list()
+    average_daily_rate = new_df['adr'].mean()
+    # Equal counts are ordered by value, the same way in every `ANALYTICS_MODE`
+    ten_most_common_guests = rank_counts(new_df['name'].value_counts()).head(10).index.to_list()
+    ten_most_popular_dates = rank_counts(new_df['booking_date'].value_counts()).head(10).index.strftime(
+        '%Y-%m-%d').to_list()
 
     return {
         'number_of_bookings': number_of_bookings,
@@ -34,22 +50,28 @@ def stats_calculation() -> dict:
     }
 
 
-def analysis_calculation() -> dict:
+@execution_mode
+def analysis_calculation(date_range: DateRange | None = None) -> dict:
     """
-    Calculate advanced analysis based on the data in the DataFrame `df`.
+    Calculate advanced analysis based on the booking dataset.
 
     Returns a dictionary containing the following analysis results:
 
     - 'booking_trends_by_month': Trends of bookings by month.
     - 'meal_packages_trends': Trends of meal packages.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns a dictionary with calculated analysis results.
     """
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
+    df = dataset.select(date_range, dataset.raw_columns())
     trends_by_month = df['arrival_date_month'].value_counts().to_dict()
     trends_meal_packages = df['meal'].value_counts().to_dict()
     guest_demographics = df['country'].value_counts().to_dict()
-    analysis = df.describe().to_dict()
+    analysis = df.describe()
+    # Statistics without values (all of them in an empty date range, 'std' of a single row) are reported as null
+    analysis = analysis.astype(object).where(analysis.notna(), None).to_dict()
 
     return {
         'booking_trends_by_month': trends_by_month,
@@ -59,6 +81,7 @@ def analysis_calculation() -> dict:
     }
 
 
+@execution_mode
 def filtering_by_nationality(country: str) -> list:
     """
     Filters booking data by guest nationality and returns the result as a list of dictionaries.
@@ -76,27 +99,29 @@ def filtering_by_nationality(country: str) -> list:
             - 'daily_rate': Daily rate.
 
     """
-    new_df = pd.read_sql_table('bookings', settings.DATABASE_URL_psycopg)
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
-    filtered_df = df[df['country'] == country]
-    selected_indices = filtered_df.index
-    filtered_by_country = new_df.loc[
-        new_df.index.isin(selected_indices), ['id', 'booking_date', 'length_of_stay', 'guest_name', 'daily_rate']]
-    return filtered_by_country.to_dict(orient='records')
+    df = dataset.select(columns=['id', 'booking_date', 'length_of_stay', 'name', 'adr'], filters={'country': country})
+    return dataset.to_booking_records(df.sort_values('id'))
 
 
-def popular_meal_package() -> dict:
+@execution_mode
+def popular_meal_package(date_range: DateRange | None = None) -> dict:
     """
     Determines the most popular meal package based on booking data and returns information about it.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns:
         dict: A dictionary containing information about the most popular meal package:
             - 'Top meal': The name of the most popular meal package.
             - 'Frequency': The number of times this package was selected.
 
     """
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
+    df = dataset.select(date_range, ['meal'])
     result = df['meal'].value_counts().nlargest(1)
+    if result.empty:
+        return {"Top meal": None, "Frequency": 0}
+
     top_meal = str(result.index[0])
     frequency = int(result.iloc[0])
 
@@ -108,28 +133,26 @@ def popular_meal_package() -> dict:
     return response_data
 
 
-def avg_length_of_stay() -> list:
+@execution_mode
+def avg_length_of_stay(date_range: DateRange | None = None) -> list:
     """
     Calculate the average length of stay per year and hotel.
 
-    This function calculates the average length of stay for guests based on the provided DataFrame.
-    It groups the data by 'arrival_date_year' and 'hotel', calculates the mean length of stay,
+    This function calculates the average length of stay for guests based on the booking dataset.
+    It groups the data by booking year and 'hotel', calculates the mean length of stay,
     and returns the result as a list of dictionaries.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns:
         List[Dict[str, Union[int, float]]]: A list of dictionaries, each containing:
-            - 'arrival_date_year' (int): The year of arrival.
+            - 'booking_date_year' (int): The year of booking.
             - 'hotel' (str): The type of hotel.
             - 'length_of_stay' (float): The average length of stay for the specified year and hotel.
     """
-    new_df = pd.read_sql_table('bookings', settings.DATABASE_URL_psycopg)
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
-    copied_df = df[['stays_in_weekend_nights', 'stays_in_week_nights', 'arrival_date_year', 'arrival_date_month',
-                    'arrival_date_day_of_month', 'hotel']].copy()
-
-    copied_df['length_of_stay'] = copied_df['stays_in_weekend_nights'] + copied_df['stays_in_week_nights']
-
-    copied_df['booking_date_year'] = pd.to_datetime(new_df['booking_date']).dt.year
+    copied_df = dataset.select(date_range, ['booking_key', 'length_of_stay', 'hotel']).copy()
+    copied_df['booking_date_year'] = calendar_dim.lookup(copied_df['booking_key'], 'year')
 
     # Calculate the mean and reset the index
     result_df = copied_df.groupby(['booking_date_year', 'hotel'])['length_of_stay'].mean().reset_index()
@@ -139,76 +162,84 @@ def avg_length_of_stay() -> list:
     return result_dict
 
 
-def total_revenue() -> list:
+@execution_mode
+def total_revenue(date_range: DateRange | None = None) -> list:
     """
     Calculates the total revenue by month and hotel.
 
     This function calculates the total revenue generated by each hotel for each month,
     excluding canceled bookings. It filters the DataFrame for non-canceled bookings,
-    groups the data by arrival month and hotel, and sums the 'adr' (average daily rate) column.
+    groups the data by booking month and hotel, and sums the revenue ('adr' times length of stay).
     The result is returned as a list of dictionaries.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns:
         List[Dict[str, Union[str, float]]]: A list of dictionaries, where each dictionary
-        contains the 'arrival_date_month', 'hotel', and 'adr_sum' (total revenue) for a specific
+        contains the 'booking_date_month', 'hotel', and 'revenue' (total revenue) for a specific
         month and hotel.
 
     """
-    new_df = pd.read_sql_table('bookings', settings.DATABASE_URL_psycopg)
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
-    copied_df = df[
-        ['adr', 'stays_in_weekend_nights', 'stays_in_week_nights', 'is_canceled', 'arrival_date_month', 'hotel']].copy()
-    copied_df['booking_date_month'] = pd.to_datetime(new_df['booking_date']).dt.strftime('%B')
-    copied_df['revenue'] = copied_df['adr'] * (copied_df['stays_in_weekend_nights'] + copied_df['stays_in_week_nights'])
-    result_df = copied_df[copied_df['is_canceled'] == 0].groupby(['booking_date_month', 'hotel'])[
-        'revenue'].sum().reset_index()
+    copied_df = dataset.select(date_range, ['adr', 'length_of_stay', 'booking_key', 'hotel'],
+                               filters={'is_canceled': 0}).copy()
+    copied_df['booking_date_month'] = calendar_dim.lookup(copied_df['booking_key'], 'month_name')
+    copied_df['revenue'] = copied_df['adr'] * copied_df['length_of_stay']
+    result_df = copied_df.groupby(['booking_date_month', 'hotel'])['revenue'].sum().reset_index()
     result_dict = result_df.to_dict(orient='records')
 
     return result_dict
 
 
-def top_countries() -> dict:
+@execution_mode
+def top_countries(date_range: DateRange | None = None) -> dict:
     """
     Retrieves the top five countries with the most bookings.
 
     This function counts the number of bookings made by each country in the dataset
     and returns the top five countries with the highest booking counts as a dictionary.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns:
         Dict[str, int]: A dictionary where keys are country codes and values are the
         respective booking counts.
 
     """
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
+    df = dataset.select(date_range, ['country'])
     return df['country'].value_counts().head(5).to_dict()
 
 
-def repeated_guests_percentages() -> dict:
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
-    repeated_guests = len(df[df['is_repeated_guest'] == 1])
+@execution_mode
+def repeated_guests_percentages(date_range: DateRange | None = None) -> dict:
+    df = dataset.select(date_range, ['is_repeated_guest'])
+    repeated_guests = int((df['is_repeated_guest'] == 1).sum())
     all_guests = len(df)
 
     return {
         'all_bookings': all_guests,
         'repeated_guests': repeated_guests,
-        'percentage_of_repeated_guests': repeated_guests / all_guests * 100
+        'percentage_of_repeated_guests': repeated_guests / all_guests * 100 if all_guests else 0.0
     }
 
 
-def total_guests_by_year() -> list:
+@execution_mode
+def total_guests_by_year(date_range: DateRange | None = None) -> list:
     """
     Calculate the total number of guests (adults, children, and babies) by booking year.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns:
         list: A list of dictionaries, each representing the total number of guests by booking year.
             Each dictionary includes the following keys:
             - 'booking_date_year': The booking year.
             - 'total_guests': The total number of guests for that year.
     """
-    new_df = pd.read_sql_table('bookings', settings.DATABASE_URL_psycopg)
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
-    copied_df = df[['adults', 'children', 'babies']].copy()
-    copied_df['booking_date_year'] = pd.to_datetime(new_df['booking_date']).dt.year
+    copied_df = dataset.select(date_range, ['adults', 'children', 'babies', 'booking_key']).copy()
+    copied_df['booking_date_year'] = calendar_dim.lookup(copied_df['booking_key'], 'year')
     copied_df['total_guests'] = copied_df[['adults', 'children', 'babies']].sum(axis=1)
 
     result_df = copied_df.groupby('booking_date_year')['total_guests'].sum().reset_index()
@@ -217,52 +248,51 @@ def total_guests_by_year() -> list:
     return result_dict
 
 
-def avg_daily_rate_resort() -> list:
+@execution_mode
+def avg_daily_rate_resort(date_range: DateRange | None = None) -> list:
     """
     Calculate the average daily rate for the 'Resort Hotel' by month.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns:
         list: A list of dictionaries, each representing the average daily rate for the 'Resort Hotel' by month.
             Each dictionary includes the following keys:
             - 'month': The month of arrival.
             - 'adr': The average daily rate for that month.
     """
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
-    copied_df = df[['hotel', 'arrival_date_month', 'adr']]
+    copied_df = dataset.select(date_range, ['arrival_date_month', 'adr'], filters={'hotel': 'Resort Hotel'})
     copied_df = copied_df.rename(columns={'arrival_date_month': 'month'})
-    filtered_df = copied_df[copied_df['hotel'] == 'Resort Hotel']
-    result_df = filtered_df.groupby('month')['adr'].mean().reset_index()
+    result_df = copied_df.groupby('month')['adr'].mean().reset_index()
     result_dict = result_df.to_dict(orient='records')
 
     return result_dict
 
 
-def most_common_arrival_day_city() -> list:
+@execution_mode
+def most_common_arrival_day_city(date_range: DateRange | None = None) -> list:
     """
     Find the most common arrival day for the 'City Hotel'.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns:
         list: A list of dictionaries, each representing the most common arrival day for the 'City Hotel'.
             Each dictionary includes the following keys:
             - 'most_common_arrival_day': The most common arrival day of the week.
     """
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
-    df['arrival_date_month'] = df['arrival_date_month'].apply(lambda x: datetime.strptime(x, '%B').month)
-    df['booking_date_arrival'] = df.apply(
-        lambda row: datetime(row['arrival_date_year'], row['arrival_date_month'], row['arrival_date_day_of_month']),
-        axis=1)
-    df['booking_date_arrival'] = df['booking_date_arrival'].dt.strftime('%Y-%m-%d')
-    copied_df = df[['booking_date_arrival', 'hotel']].copy()
-    copied_df['booking_date_arrival'] = pd.to_datetime(copied_df['booking_date_arrival']).dt.strftime('%A')
-    copied_df = copied_df.rename(columns={'booking_date_arrival': 'most_common_arrival_day'})
-    result_df = copied_df[copied_df['hotel'] == 'City Hotel']['most_common_arrival_day'].value_counts().head(
-        1).reset_index()
+    df = dataset.select(date_range, ['arrival_key'], filters={'hotel': 'City Hotel'})
+    arrival_days = pd.Series(calendar_dim.lookup(df['arrival_key'], 'weekday'), name='most_common_arrival_day')
+    result_df = arrival_days.value_counts().head(1).reset_index()
     result_dict = result_df.to_dict(orient='records')
 
     return result_dict
 
 
-def count_by_hotel_meal() -> list:
+@execution_mode
+def count_by_hotel_meal(date_range: DateRange | None = None) -> list:
     """
     Count the number of bookings by hotel and meal type.
 
@@ -271,11 +301,13 @@ def count_by_hotel_meal() -> list:
     - 'meal': The meal type.
     - 'count': The number of bookings for the hotel and meal type.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns:
         list[dict]: A list of dictionaries representing the count of bookings by hotel and meal type.
     """
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
-    copied_df = df[['hotel', 'meal']]
+    copied_df = dataset.select(date_range, ['hotel', 'meal'])
     result_df = copied_df.groupby(['hotel', 'meal']).size().reset_index(name='count').sort_values(by='count',
                                                                                                   ascending=False)
     result_dict = result_df.to_dict(orient='records')
@@ -283,7 +315,8 @@ def count_by_hotel_meal() -> list:
     return result_dict
 
 
-def total_revenue_resort_by_country() -> list:
+@execution_mode
+def total_revenue_resort_by_country(date_range: DateRange | None = None) -> list:
     """
     Calculate the total revenue for Resort Hotel by country.
 
@@ -291,21 +324,24 @@ def total_revenue_resort_by_country() -> list:
     - 'country': The country name.
     - 'total_revenue': The total revenue generated by bookings in the Resort Hotel for that country.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns:
         list[dict]: A list of dictionaries representing the total revenue for Resort Hotel by country.
     """
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
-    copied_df = df[['adr', 'stays_in_weekend_nights', 'stays_in_week_nights', 'is_canceled', 'hotel', 'country']].copy()
-    copied_df['total_revenue'] = copied_df['adr'] * (
-            copied_df['stays_in_weekend_nights'] + copied_df['stays_in_week_nights'])
-    result_df = copied_df[(copied_df['is_canceled'] == 0) & (copied_df['hotel'] == 'Resort Hotel')].groupby('country')[
-        'total_revenue'].sum().reset_index().sort_values(by='total_revenue', ascending=False)
+    copied_df = dataset.select(date_range, ['adr', 'length_of_stay', 'country'],
+                               filters={'is_canceled': 0, 'hotel': 'Resort Hotel'}).copy()
+    copied_df['total_revenue'] = copied_df['adr'] * copied_df['length_of_stay']
+    result_df = copied_df.groupby('country')['total_revenue'].sum().reset_index().sort_values(by='total_revenue',
+                                                                                               ascending=False)
     result_dict = result_df.to_dict(orient='records')
 
     return result_dict
 
 
-def count_by_hotel_repeated_guest() -> list:
+@execution_mode
+def count_by_hotel_repeated_guest(date_range: DateRange | None = None) -> list:
     """
     Count the number of repeated and not repeated guests by hotel.
 
@@ -314,14 +350,72 @@ def count_by_hotel_repeated_guest() -> list:
     - 'is_repeated_guest': Whether the guest is repeated or not ('repeated' or 'not_repeated').
     - 'count': The number of guests in each category for the hotel.
 
+    Args:
+        date_range (DateRange, optional): Period to restrict the calculation to.
+
     Returns:
         list[dict]: A list of dictionaries representing the count of repeated and not repeated guests by hotel.
     """
-    df = pd.read_csv('app/data/hotel_booking_data.csv')
-    copied_df = df[['is_repeated_guest', 'hotel']]
+    copied_df = dataset.select(date_range, ['is_repeated_guest', 'hotel'])
     result_df = copied_df.groupby(['hotel', 'is_repeated_guest']).size().reset_index(name='count')
 
     result_df['is_repeated_guest'] = result_df['is_repeated_guest'].replace({0: 'not_repeated', 1: 'repeated'})
     result_dict = result_df.to_dict(orient='records')
 
     return result_dict
+
+
+@execution_mode
+def nightly_occupancy(date_range: DateRange | None = None) -> list:
+    """
+    Calculate the number of occupied rooms and the realized revenue per night and hotel.
+
+    Every non-canceled stay adds +1 (and its daily rate) at its arrival night and -1 (and minus its daily rate)
+    at its departure day in a difference array; the cumulative sum gives the value per night. The work is
+    linear in the number of bookings plus the number of nights, however long the stays are.
+
+    Args:
+        date_range (DateRange, optional): Nights to return (the date field is ignored, the bounds always
+            apply to the nights).
+
+    Returns:
+        list[dict]: A list of dictionaries, each containing:
+            - 'hotel' (str): The type of hotel.
+            - 'date' (str): The night.
+            - 'occupied_rooms' (int): Number of stays covering that night.
+            - 'revenue' (float): Sum of the daily rates of those stays.
+    """
+    df = dataset.select(columns=['hotel', 'arrival_key', 'length_of_stay', 'adr'], filters={'is_canceled': 0})
+    if df.empty:
+        return []
+
+    arrival_keys = df['arrival_key'].to_numpy()
+    origin = int(arrival_keys.min())
+    starts = arrival_keys - origin
+    ends = starts + df['length_of_stay'].to_numpy()
+    nights = pd.DatetimeIndex(calendar_dim.lookup(np.arange(origin, origin + int(ends.max()) + 1), 'date'))
+
+    first, last = 0, len(nights)
+    if date_range is not None and date_range.date_from is not None:
+        first = nights.searchsorted(pd.Timestamp(date_range.date_from), side='left')
+    if date_range is not None and date_range.date_to is not None:
+        last = nights.searchsorted(pd.Timestamp(date_range.date_to), side='right')
+
+    result = []
+    for hotel, positions in df.groupby('hotel').indices.items():
+        hotel_starts, hotel_ends = starts[positions], ends[positions]
+        rates = df['adr'].to_numpy()[positions]
+        size = len(nights) + 1
+
+        occupancy = np.cumsum(np.bincount(hotel_starts, minlength=size) - np.bincount(hotel_ends, minlength=size))
+        revenue = np.cumsum(np.bincount(hotel_starts, weights=rates, minlength=size)
+                            - np.bincount(hotel_ends, weights=rates, minlength=size))
+
+        result.extend({
+            'hotel': hotel,
+            'date': night.strftime('%Y-%m-%d'),
+            'occupied_rooms': int(occupancy[index]),
+            'revenue': round(float(revenue[index]), 2)
+        } for index, night in enumerate(nights[first:last], start=first))
+
+    return result
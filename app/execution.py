@@ -0,0 +1,35 @@
+import functools
+import inspect
+from config import settings
+from app import chunked, parallel
+
+
+def execution_mode(func):
+    """
+    Run an analytic from `app.dependencies` the way the `ANALYTICS_MODE` setting selects.
+
+    - 'memory': the function itself, on the dataset held in memory.
+    - 'chunked': out of core, streaming the csv file in chunks (see `chunked.compute`).
+    - 'parallel': partitioned across `ANALYTICS_WORKERS` processes (see `parallel.compute`).
+
+    The 'chunked' and 'parallel' results match the 'memory' ones up to the rounding of float sums, except
+    in 'chunked' mode for the quartiles of `analysis_calculation`, which are estimated (see
+    `chunked.ColumnMoments`), and the most common guest names of `stats_calculation`, which come from a
+    Space-Saving summary.
+
+    The analytic must have an entry of the same name in `chunked.ANALYTICS`.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if settings.ANALYTICS_MODE == 'memory':
+            return func(*args, **kwargs)
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        if settings.ANALYTICS_MODE == 'chunked':
+            return chunked.compute(func.__name__, *bound.args)
+        return parallel.compute(func.__name__, *bound.args)
+
+    return wrapper
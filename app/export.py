@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+from datetime import datetime
+from database import Session
+from app import db_queries
+
+EXPORT_COLUMNS = ['id', 'guest_name', 'booking_date', 'length_of_stay', 'daily_rate']
+
+MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the caller chunk by chunk."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _encode_csv(partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in partitions:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _encode_ndjson(partitions):
+    for rows in partitions:
+        yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str) + '\n' for row in rows).encode()
+
+
+def _encode_parquet(partitions):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('guest_name', pa.string()),
+        ('booking_date', pa.date32()),
+        ('length_of_stay', pa.int64()),
+        ('daily_rate', pa.float64()),
+    ])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in partitions:
+            columns = list(zip(*rows))
+            # Same types as the Arrow responses of the booking lists (see `formats._encode_arrow`)
+            columns[2] = [value.date() if isinstance(value, datetime) else value for value in columns[2]]
+            arrays = [pa.array(column, type=field.type) for column, field in zip(columns, schema)]
+            # Each batch of rows becomes one row group
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+ENCODERS = {
+    'csv': _encode_csv,
+    'ndjson': _encode_ndjson,
+    'parquet': _encode_parquet,
+}
+
+
+def export_bookings(export_format: str, guest_name: str = None, book_date: str = None, length_of_stay: int = None,
+                    batch_size: int = 10000):
+    """
+    Encode the bookings table to the requested format while it is read from the database.
+
+    The rows are fetched from a server-side cursor `batch_size` at a time and each batch is encoded and
+    handed out before the next one is fetched, so memory use does not depend on the number of rows.
+
+    :param export_format: 'csv', 'ndjson' or 'parquet'.
+    :param guest_name: Optional guest name filter (as in `/bookings/search`).
+    :param book_date: Optional booking date filter (as in `/bookings/search`).
+    :param length_of_stay: Optional length of stay filter (as in `/bookings/search`).
+    :param batch_size: Number of rows fetched and encoded at a time.
+    :return: An iterator over encoded chunks of bytes.
+    """
+    with Session() as db:
+        partitions = db_queries.stream_bookings(db, guest_name, book_date, length_of_stay, batch_size=batch_size)
+        for chunk in ENCODERS[export_format](partitions):
+            if chunk:
+                yield chunk
@@ -0,0 +1,138 @@
+import json
+from datetime import date, datetime
+from typing import Annotated
+from fastapi import Header, Response
+
+BOOKING_COLUMNS = ['id', 'guest_name', 'booking_date', 'length_of_stay', 'daily_rate']
+
+JSON_ROWS = 'application/json'
+COLUMNAR_JSON = 'application/vnd.bookings.columnar+json'
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+# Extra media types of the booking list endpoints, for the OpenAPI documentation
+BOOKING_LIST_RESPONSES = {
+    200: {
+        'content': {
+            COLUMNAR_JSON: {'example': {'id': [0, 1], 'guest_name': ['Ernest Barnes', 'Andrea Baker'],
+                                        'booking_date': ['2014-07-24', '2015-06-24'], 'length_of_stay': [0, 0],
+                                        'daily_rate': [0.0, 0.0]}},
+            ARROW_STREAM: {},
+        },
+        'description': "Bookings as JSON rows (default), as JSON columns or as an Arrow IPC stream, "
+                       "depending on the Accept header",
+    }
+}
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def booking_columns(bookings) -> dict:
+    """
+    Transpose bookings into columns.
+
+    :param bookings: Booking rows (see `db_queries.booking_rows`) or dictionaries with the keys of
+        `BookingModel`.
+    :return: A dictionary with one list per column of `BookingModel`.
+    """
+    if bookings and isinstance(bookings[0], dict):
+        columns = {name: [booking[name] for booking in bookings] for name in BOOKING_COLUMNS}
+    else:
+        columns = {name: [getattr(booking, name) for booking in bookings] for name in BOOKING_COLUMNS}
+    columns['booking_date'] = [_as_date(value) for value in columns['booking_date']]
+    return columns
+
+
+def _encode_json(value) -> bytes:
+    return json.dumps(value, default=date.isoformat, separators=(',', ':')).encode()
+
+
+def _encode_json_rows(columns: dict) -> bytes:
+    return _encode_json([dict(zip(BOOKING_COLUMNS, row)) for row in zip(*columns.values())])
+
+
+def _encode_columnar_json(columns: dict) -> bytes:
+    return _encode_json(columns)
+
+
+def _encode_arrow(columns: dict) -> bytes:
+    import pyarrow as pa
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('guest_name', pa.string()),
+        ('booking_date', pa.date32()),
+        ('length_of_stay', pa.int64()),
+        ('daily_rate', pa.float64()),
+    ])
+    table = pa.Table.from_arrays([pa.array(columns[field.name], type=field.type) for field in schema], schema=schema)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {
+    JSON_ROWS: _encode_json_rows,
+    COLUMNAR_JSON: _encode_columnar_json,
+    ARROW_STREAM: _encode_arrow,
+}
+
+
+def negotiate(accept: str | None) -> str:
+    """
+    Pick the response format of a booking list from the Accept header.
+
+    :param accept: Value of the Accept header.
+    :return: `COLUMNAR_JSON` or `ARROW_STREAM` if the client prefers one of them, otherwise `JSON_ROWS`.
+    """
+    if not accept:
+        return JSON_ROWS
+
+    preferred, preferred_quality = None, 0.0
+    for item in accept.split(','):
+        media_type, *parameters = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for parameter in parameters:
+            key, _, value = parameter.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        # Ties go to the first media type listed; JSON rows are chosen by 'application/json' or '*/*'
+        if quality > preferred_quality:
+            preferred, preferred_quality = media_type.lower(), quality
+    return preferred if preferred in ENCODERS else JSON_ROWS
+
+
+def bookings_response(bookings, accept: str | None) -> Response:
+    """
+    Return a booking list in the format negotiated with the client.
+
+    The bookings are encoded directly (they already have the fields of `BookingModel`), without being
+    validated again into response models.
+
+    :param bookings: Booking rows (see `db_queries.booking_rows`) or dictionaries with the keys of
+        `BookingModel`.
+    :param accept: Value of the Accept header.
+    :return: A Response with the bookings as JSON rows, JSON columns or an Arrow IPC stream.
+    """
+    media_type = negotiate(accept)
+    return Response(content=ENCODERS[media_type](booking_columns(bookings)), media_type=media_type)
+
+
+def booking_response(booking) -> Response:
+    """
+    Return a single booking row as a JSON object, without validating it again into a response model.
+
+    :param booking: A booking row (see `db_queries.booking_rows`).
+    """
+    return Response(content=_encode_json(booking._asdict()), media_type=JSON_ROWS)
+
+
+accept_dependencies = Annotated[str | None, Header(description="application/json (rows, default), "
+                                                               f"{COLUMNAR_JSON} or {ARROW_STREAM}")]
@@ -1,13 +1,25 @@
-from sqlalchemy import Column, Integer, String, Float, Date
+from sqlalchemy import BigInteger, Column, Integer, String, Float, Date
 from database import Base
 
 
 # Определите модель SQLAlchemy на основе данных из DataFrame
 class Booking(Base):
     __tablename__ = 'bookings'
-    __table_args__ = {'extend_existing': True}
-    id = Column(Integer, primary_key=True)
-    booking_date = Column(Date)
+    # Partitioned by range of booking date; the partitions are created on demand during ingest
+    # (see startup.save_partitions). The partition key has to be part of the primary key.
+    __table_args__ = {'extend_existing': True, 'postgresql_partition_by': 'RANGE (booking_date)'}
+    # Hash of the booking values, see app.dataset.booking_ids
+    id = Column(BigInteger, primary_key=True)
+    booking_date = Column(Date, primary_key=True)
     length_of_stay = Column(Integer)
     guest_name = Column(String)
     daily_rate = Column(Float)
+
+
+class BookingPartition(Base):
+    __tablename__ = 'booking_partitions'
+    name = Column(String, primary_key=True)
+    date_from = Column(Date)
+    date_to = Column(Date)
+    fingerprint = Column(String)
+    rows = Column(Integer)
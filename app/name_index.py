@@ -0,0 +1,143 @@
+import math
+import threading
+import numpy as np
+import pandas as pd
+from app import dataset
+
+NGRAM_SIZE = 3
+# Share of the query trigrams a name must contain to be ranked by the typo-tolerant lookup
+MIN_OVERLAP = 0.5
+
+# Dataset the index was built for
+_source = None
+# Lower-cased guest names in sorted order and the dataset row positions in the same order
+_sorted_names = None
+_sorted_positions = None
+# Distinct names, the first position of each one in `_sorted_names` and the number of bookings per name
+_unique_names = None
+_unique_starts = None
+_unique_counts = None
+# Trigram -> indices into `_unique_names`, in increasing order
+_postings = {}
+# The index is built by one thread at a time; lookups arriving meanwhile wait for it
+_build_lock = threading.Lock()
+
+
+def _ngrams(name: str) -> set:
+    padded = f"  {name} "
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+def build_name_index(columns: dataset.LazyColumns) -> None:
+    """
+    Build the guest name lookup index for the booking dataset.
+
+    Keeps the lower-cased names as a sorted array (a prefix lookup is two binary searches) and trigram posting
+    lists over the distinct names for typo-tolerant lookup.
+
+    :param columns: The columns of the booking dataset (see `dataset.store`); only 'name' is read.
+    """
+    global _source, _sorted_names, _sorted_positions, _unique_names, _unique_starts, _unique_counts, _postings
+
+    names = pd.Series(columns.column('name')).fillna('').astype(str).str.lower().to_numpy(dtype=str)
+    order = np.argsort(names, kind='stable')
+    sorted_names = names[order]
+
+    unique_names, unique_starts, unique_counts = np.unique(sorted_names, return_index=True, return_counts=True)
+
+    postings = {}
+    for name_index, name in enumerate(unique_names):
+        for gram in _ngrams(name):
+            postings.setdefault(gram, []).append(name_index)
+
+    _sorted_names = sorted_names
+    _sorted_positions = order
+    _unique_names = unique_names
+    _unique_starts = unique_starts
+    _unique_counts = unique_counts
+    _postings = {gram: np.array(indices, dtype=np.int32) for gram, indices in postings.items()}
+    _source = columns
+
+
+def _ensure_index() -> None:
+    columns = dataset.store()
+    if _source is not columns:
+        with _build_lock:
+            if _source is not columns:
+                build_name_index(columns)
+
+
+def build_in_background() -> threading.Thread:
+    """
+    Build the index of the current dataset in a background thread (e.g. after a restart), so the first lookup
+    does not pay for it.
+
+    :return: The started thread.
+    """
+    thread = threading.Thread(target=_ensure_index, name='name-index', daemon=True)
+    thread.start()
+    return thread
+
+
+def _prefix_positions(prefix: str, limit: int) -> np.ndarray:
+    start = np.searchsorted(_sorted_names, prefix, side='left')
+    stop = np.searchsorted(_sorted_names, prefix + '\uffff', side='left')
+    return _sorted_positions[start:min(stop, start + limit)]
+
+
+def _fuzzy_positions(query: str, limit: int) -> np.ndarray:
+    query_grams = _ngrams(query)
+    lists = sorted((_postings[gram] for gram in query_grams if gram in _postings), key=len)
+    min_hits = max(1, math.ceil(MIN_OVERLAP * len(query_grams)))
+    if len(lists) < min_hits:
+        return np.array([], dtype=np.intp)
+
+    # A name containing `min_hits` of the trigrams is in at least one of the `len(lists) - min_hits + 1`
+    # shortest posting lists, so the most common trigrams only have to be probed for those candidates
+    candidates = np.unique(np.concatenate(lists[:len(lists) - min_hits + 1]))
+    hits = np.zeros(len(candidates), dtype=np.int32)
+    for postings in lists:
+        found = np.minimum(np.searchsorted(postings, candidates), len(postings) - 1)
+        hits += postings[found] == candidates
+    candidates, hits = candidates[hits >= min_hits], hits[hits >= min_hits]
+
+    # Jaccard similarity of trigram sets; a name of length L has L + 1 padded trigrams
+    name_grams = np.char.str_len(_unique_names[candidates]) + 1
+    scores = hits / (len(query_grams) + name_grams - hits)
+    # Every name has at least one booking, so the `limit` best names are enough
+    if len(candidates) > limit:
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        candidates, scores = candidates[top], scores[top]
+    best = candidates[np.argsort(-scores, kind='stable')]
+
+    positions = []
+    for name_index in best:
+        start = _unique_starts[name_index]
+        positions.extend(_sorted_positions[start:start + _unique_counts[name_index]])
+        if len(positions) >= limit:
+            break
+    return np.array(positions[:limit], dtype=np.intp)
+
+
+def lookup_guest_name(query: str, limit: int = 10, fuzzy: bool = False) -> list:
+    """
+    Find bookings whose guest name matches a query.
+
+    Args:
+        query (str): Beginning of the guest name (case-insensitive), or an approximate name when `fuzzy` is set.
+        limit (int, optional): Maximum number of bookings to return (default is 10).
+        fuzzy (bool, optional): Rank names by trigram similarity instead of matching the prefix.
+
+    Returns:
+        list[dict]: Up to `limit` bookings, with the same keys as `BookingModel`.
+    """
+    _ensure_index()
+    query = query.strip().lower()
+
+    if fuzzy:
+        positions = _fuzzy_positions(query, limit)
+    else:
+        positions = _prefix_positions(query, limit)
+
+    bookings = dataset.store().frame(['id', 'booking_date', 'length_of_stay', 'name', 'adr'], positions)
+    return dataset.to_booking_records(bookings)
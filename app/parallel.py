@@ -0,0 +1,102 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from config import settings as stt
+from app import chunked, dataset
+import settings
+
+# Rows per block. Blocks are the unit of work and of merging, whatever the number of workers, so the
+# result does not depend on the number of workers.
+BLOCK_SIZE = 1 << 16
+
+# Worker pool and the (workers, dataset version) it was started for
+_pool = None
+_pool_key = None
+# Replacing the pool and submitting work to it happen under this lock, so a request never submits to a pool
+# another request has just shut down
+_pool_lock = threading.Lock()
+
+
+def _block_partials(name: str, start: int, stop: int, args: tuple) -> list:
+    """
+    Compute the partial aggregates of the blocks of rows [start, stop) of the dataset.
+
+    Runs in the worker processes (and in-process with one worker).
+    """
+    frame = dataset.get_dataset()
+    return [chunked.partial_aggregate(name, frame.iloc[block:min(block + BLOCK_SIZE, stop)], *args, exact=True)
+            for block in range(start, stop, BLOCK_SIZE)]
+
+
+def _init_worker(data_path: str) -> None:
+    dataset.DATA_PATH = data_path
+    dataset.get_dataset()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_key
+
+    key = (workers, settings.dataset_version)
+    if _pool is None or _pool_key != key:
+        if _pool is not None:
+            # Work already submitted by other requests finishes before the old workers exit
+            _pool.shutdown(wait=False)
+        # Workers are started without forking the (multi-threaded) server and load the dataset once
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method),
+                                    initializer=_init_worker, initargs=(dataset.DATA_PATH,))
+        _pool_key = key
+    return _pool
+
+
+def shutdown_pool() -> None:
+    """
+    Stop the worker processes, if any.
+    """
+    global _pool, _pool_key
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+        _pool = None
+        _pool_key = None
+
+
+def compute(name: str, *args, workers: int | None = None):
+    """
+    Compute an analytic by partitioning the dataset across worker processes.
+
+    The rows are cut into blocks of `BLOCK_SIZE`, contiguous runs of blocks are handed to the workers and
+    the partial aggregates of all blocks are merged in block order. With one worker the same blocks are
+    computed in-process, so the results are identical for any number of workers.
+
+    The blocks use the exact aggregates (see `chunked.EXACT_ANALYTICS`), so the results match the 'memory'
+    mode (pandas over the whole dataset) up to the rounding of float sums, which are added up in a different
+    order.
+
+    :param name: Name of the analytic (a key of `chunked.ANALYTICS`).
+    :param args: Arguments of the analytic.
+    :param workers: Number of worker processes (default: the `ANALYTICS_WORKERS` setting).
+    :return: The result, in the same format as the in-memory analytic.
+    """
+    workers = workers or stt.ANALYTICS_WORKERS
+    rows = dataset.row_count()
+    blocks = list(range(0, rows, BLOCK_SIZE))
+
+    if workers <= 1 or len(blocks) <= 1:
+        partials = _block_partials(name, 0, rows, args)
+    else:
+        per_worker = -(-len(blocks) // workers)
+        with _pool_lock:
+            pool = _get_pool(workers)
+            futures = [pool.submit(_block_partials, name, blocks[i],
+                                   min(blocks[i] + per_worker * BLOCK_SIZE, rows), args)
+                       for i in range(0, len(blocks), per_worker)]
+        partials = [partial for future in futures for partial in future.result()]
+
+    merged = {}
+    for partial in partials:
+        chunked.merge_partials(merged, partial)
+    if not merged:
+        merged = chunked.partial_aggregate(name, dataset.get_dataset().iloc[:0], *args, exact=True)
+    return chunked.finalize(name, merged, *args, exact=True)
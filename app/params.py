@@ -0,0 +1,86 @@
+from fastapi import Depends, HTTPException, Query, status
+from typing import Annotated, Literal
+from datetime import date
+from app.schemas import CubeDimension, CubeQuery, DateRange
+from config import settings as stt
+
+
+def check_in_memory(feature: str) -> None:
+    """
+    Reject a feature that needs the dataset held in memory when the analytics run in 'chunked' mode, instead
+    of loading the whole csv file into memory for it.
+
+    :param feature: Name of the feature, for the error message.
+    """
+    if stt.ANALYTICS_MODE == 'chunked':
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail=f"{feature} not available in 'chunked' analytics mode")
+
+
+def date_range_params(
+        date_from: Annotated[
+            date | None, Query(alias='from', title="Start date", description="First date of the period (inclusive)")
+        ] = None,
+        date_to: Annotated[
+            date | None, Query(alias='to', title="End date", description="Last date of the period (inclusive)")
+        ] = None,
+        date_field: Annotated[
+            Literal['arrival', 'booking'], Query(title="Date field",
+                                                 description="Whether the period applies to arrival or booking date")
+        ] = 'arrival'
+) -> DateRange:
+    """
+    Collect the optional date range query parameters of the analytics endpoints.
+
+    - **from**: First date of the period (inclusive).
+    - **to**: Last date of the period (inclusive).
+    - **date_field**: 'arrival' or 'booking' date the period applies to.
+    """
+    if date_from is not None and date_to is not None and date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' date must not be after 'to' date")
+
+    return DateRange(date_from=date_from, date_to=date_to, field=date_field)
+
+
+date_range_dependencies = Annotated[DateRange, Depends(date_range_params)]
+
+
+sample_dependencies = Annotated[
+    bool, Query(title="Sampled estimate",
+                description="Estimate from a stratified sample, with 95% confidence intervals, instead of computing "
+                            "over all bookings")
+]
+
+
+def cube_query_params(
+        group_by: Annotated[
+            list[CubeDimension], Query(title="Group by", description="Dimensions to keep; the others are rolled up")
+        ] = [],
+        year: Annotated[list[int] | None, Query(title="Years", description="Arrival years to keep")] = None,
+        month: Annotated[list[int] | None, Query(title="Months", description="Arrival months (1-12) to keep")] = None,
+        hotel: Annotated[list[str] | None, Query(title="Hotels", description="Hotel types to keep")] = None,
+        country: Annotated[list[str] | None, Query(title="Countries", description="Countries to keep")] = None,
+        meal: Annotated[list[str] | None, Query(title="Meal packages", description="Meal packages to keep")] = None,
+        is_repeated_guest: Annotated[
+            list[int] | None, Query(title="Repeated guest", description="0 (new guests) and/or 1 (repeated guests)")
+        ] = None,
+        is_canceled: Annotated[
+            list[int] | None, Query(title="Canceled", description="0 (kept bookings) and/or 1 (canceled bookings)")
+        ] = None
+) -> CubeQuery:
+    """
+    Collect the query parameters of the cube endpoint.
+
+    Every filter can be repeated (e.g. `?year=2016&year=2017`) to keep several values of a dimension.
+
+    - **group_by**: Dimensions to keep; the others are rolled up.
+    - **year**, **month**, **hotel**, **country**, **meal**, **is_repeated_guest**, **is_canceled**:
+      Dimension values to keep.
+    """
+    filters = {'year': year, 'month': month, 'hotel': hotel, 'country': country, 'meal': meal,
+               'is_repeated_guest': is_repeated_guest, 'is_canceled': is_canceled}
+    return CubeQuery(group_by=tuple(dict.fromkeys(group_by)),
+                     **{dimension: None if values is None else tuple(values) for dimension, values in filters.items()})
+
+
+cube_query_dependencies = Annotated[CubeQuery, Depends(cube_query_params)]
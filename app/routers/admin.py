@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Query, status
+from typing import Annotated
+from auth_dep import admin_dependencies
+import slow_queries
+
+router = APIRouter(
+    prefix='/admin',
+    tags=['Admin']
+)
+
+
+@router.get(
+    '/slow_queries',
+    summary="Lists the slowest database statements of every route",
+    status_code=status.HTTP_200_OK
+)
+async def get_slow_queries(
+        username: admin_dependencies,
+        limit: Annotated[int, Query(title="Limit number of statements",
+                                    description="Number of statements returned per route", ge=1, le=100)] = 10
+):
+    """
+    Lists the database statements slower than the `SLOW_QUERY_THRESHOLD_MS` setting, per route.
+
+    Only the users listed in the `ADMIN_USERNAMES` setting are allowed (the statements and plans describe the
+    data and the schema).
+
+    Returns, for every route, its slowest statements (longest execution first) with the number of slow
+    executions, their mean, total and longest duration, the types of the bound parameters and,
+    when one was captured, the `EXPLAIN (ANALYZE, BUFFERS)` plan.
+
+    - **limit**: Number of statements returned per route.
+    """
+    return slow_queries.worst_queries(limit)
+
+
+@router.delete(
+    '/slow_queries',
+    summary="Clears the slow statement log",
+    status_code=status.HTTP_204_NO_CONTENT
+)
+async def clear_slow_queries(username: admin_dependencies):
+    """
+    Forgets the recorded slow statements. Only the users listed in the `ADMIN_USERNAMES` setting are allowed.
+    """
+    slow_queries.reset()
@@ -1,10 +1,18 @@
 from fastapi import APIRouter, HTTPException, Query, status
 from typing import Annotated
+from admission import analytics_admission, lookup_admission
 from auth_dep import auth_dependencies
 from app.schemas import BookingModel
-import app.dependencies as dep
+from app.formats import BOOKING_LIST_RESPONSES, accept_dependencies, bookings_response
+from app.params import check_in_memory, cube_query_dependencies, date_range_dependencies, sample_dependencies
+from app.single_flight import run_coalesced
+from lazy_modules import lazy_import
 import settings
 
+dep = lazy_import('app.dependencies')
+cube = lazy_import('app.cube')
+sampling = lazy_import('app.sampling')
+
 router = APIRouter(
     prefix='/bookings',
     tags=['Advanced bookings']
@@ -15,16 +23,20 @@ router = APIRouter(
     '/nationality',
     summary="Get bookings based on nationality",
     status_code=status.HTTP_200_OK,
-    response_model=list[BookingModel]
+    response_model=list[BookingModel],
+    responses=BOOKING_LIST_RESPONSES,
+    dependencies=[lookup_admission]
 )
 async def get_booking_by_nationality(
         country: Annotated[
-            str, Query(title="The country", description="The country of nationality for which to retrieve bookings")]
+            str, Query(title="The country", description="The country of nationality for which to retrieve bookings")],
+        accept: accept_dependencies = None
 ):
     """
     Get bookings based on nationality.
 
-    Returns bookings matching the provided nationality.
+    Returns bookings matching the provided nationality, as JSON rows, JSON columns or an Arrow IPC stream
+    depending on the Accept header.
 
     Valid values: PRT, GBR, FRA, ESP, DEU, ITA, IRL, BEL, BRA, NLD, USA, CHE, CN, AUT, SWE, CHN, POL, ISR, RUS, NOR, ROU, FIN, DNK, AUS, AGO, LUX, MAR, TUR, HUN, ARG, JPN, CZE, IND, KOR, GRC, DZA, SRB, HRV, MEX, EST, IRN, LTU, ZAF, BGR, NZL, COL, UKR, MOZ, CHL, SVK, THA, SVN, ISL, LVA, ARE, CYP, TWN, SAU, PHL, TUN, SGP, IDN, NGA, EGY, URY, LBN, PER, HKG, MYS, ECU, VEN, BLR, CPV, GEO, JOR, KAZ, CRI, GIB, MLT, OMN, AZE, KWT, MAC, QAT, IRQ, DOM, PAK, BIH, MDV, BGD, ALB, PRI, SEN, CMR, MKD, BOL, PAN, GNB, TJK, VNM, CUB, ARM, JEY, LBY, AND, MUS, LKA, CIV, JAM, KEN, FRO, MNE, TZA, BHR, CAF, SUR, PRY, BRB, GTM, UZB, MCO, GAB, GHA, ZWE, ETH, TMP, LIE, GGY, SYR, BEN, GLP, SLV, ATA, MYT, ABW, KHM, LAO, STP, ZMB, MWI, IMN, COM, TGO, UGA, KNA, RWA, SYC, KIR, SDN, NCL, AIA, ASM, FJI, ATF, LCA, GUY, PYF, DMA, SLE, MRT, NIC, BDI, PLW, MLI, CYM, BFA, MDG, MMR, NPL, BHS, UMI, SMR, DJI, BWA, HND, VGB, NAM
 
@@ -33,20 +45,21 @@ async def get_booking_by_nationality(
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    results = dep.filtering_by_nationality(country)
+    results = await run_coalesced(dep.filtering_by_nationality, country)
 
     if not results:
         raise HTTPException(status_code=404, detail="No bookings found")
 
-    return results
+    return bookings_response(results, accept)
 
 
 @router.get(
     '/popular_meal_package',
     summary="Retrieves the most popular meal package among all bookings",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_popular_meal_package():
+async def get_popular_meal_package(date_range: date_range_dependencies):
     """
     Retrieves the most popular meal package among all bookings.
 
@@ -55,49 +68,60 @@ async def get_popular_meal_package():
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.popular_meal_package()
+    return await run_coalesced(dep.popular_meal_package, date_range)
 
 
 @router.get(
     '/avg_length_of_stay',
     summary="Retrieves the average length of stay grouped by booking year and hotel type",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_avg_length_of_stay():
+async def get_avg_length_of_stay(date_range: date_range_dependencies, sample: sample_dependencies = False):
     """
     Retrieves the average length of stay grouped by booking year and hotel type.
 
     Returns the average length of stay for each combination of booking year and hotel type.
+    With `sample` set, returns estimates from a stratified sample with their 95% confidence intervals.
     """
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.avg_length_of_stay()
+    if sample:
+        check_in_memory("Sampled estimates")
+        return await run_coalesced(sampling.avg_length_of_stay, date_range)
+    return await run_coalesced(dep.avg_length_of_stay, date_range)
 
 
 @router.get(
     '/total_revenue',
     summary="Retrieves the total revenue",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_total_revenue():
+async def get_total_revenue(date_range: date_range_dependencies, sample: sample_dependencies = False):
     """
     Retrieves the total revenue grouped by booking month and hotel type.
 
     Returns the total revenue for each combination of booking month and hotel type.
+    With `sample` set, returns estimates from a stratified sample with their 95% confidence intervals.
     """
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.total_revenue()
+    if sample:
+        check_in_memory("Sampled estimates")
+        return await run_coalesced(sampling.total_revenue, date_range)
+    return await run_coalesced(dep.total_revenue, date_range)
 
 
 @router.get(
     '/top_countries',
     summary="Retrieves the top 5 countries with the highest number of bookings",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_top_countries():
+async def get_top_countries(date_range: date_range_dependencies):
     """
     Retrieves the top 5 countries with the highest number of bookings.
 
@@ -106,15 +130,16 @@ async def get_top_countries():
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.top_countries()
+    return await run_coalesced(dep.top_countries, date_range)
 
 
 @router.get(
     '/repeated_guests_percentage',
     summary="Retrieves the percentage of repeated guests among all bookings",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_repeated_guests_percentages():
+async def get_repeated_guests_percentages(date_range: date_range_dependencies):
     """
     Retrieves the percentage of repeated guests among all bookings.
 
@@ -123,15 +148,16 @@ async def get_repeated_guests_percentages():
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.repeated_guests_percentages()
+    return await run_coalesced(dep.repeated_guests_percentages, date_range)
 
 
 @router.get(
     '/total_guests_by_year',
     summary="Retrieves the total number of guests (adults, children, and babies) by booking year",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_total_guests_by_year():
+async def get_total_guests_by_year(date_range: date_range_dependencies):
     """
     Retrieves the total number of guests (adults, children, and babies) by booking year.
 
@@ -140,32 +166,39 @@ async def get_total_guests_by_year():
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.total_guests_by_year()
+    return await run_coalesced(dep.total_guests_by_year, date_range)
 
 
 @router.get(
     '/avg_daily_rate_resort',
     summary="Retrieves the average daily rate by month for resort hotel bookings",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_avg_daily_rate_resort(username: auth_dependencies):
+async def get_avg_daily_rate_resort(username: auth_dependencies, date_range: date_range_dependencies,
+                                    sample: sample_dependencies = False):
     """
     Retrieves the average daily rate by month for resort hotel bookings.
 
     Returns the average daily rate by month for resort hotel bookings.
+    With `sample` set, returns estimates from a stratified sample with their 95% confidence intervals.
     """
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.avg_daily_rate_resort()
+    if sample:
+        check_in_memory("Sampled estimates")
+        return await run_coalesced(sampling.avg_daily_rate_resort, date_range)
+    return await run_coalesced(dep.avg_daily_rate_resort, date_range)
 
 
 @router.get(
     '/most_common_arrival_day_city',
     summary="Retrieves the most common arrival date day of the week for city hotel bookings",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_most_common_arrival_day_city(username: auth_dependencies):
+async def get_most_common_arrival_day_city(username: auth_dependencies, date_range: date_range_dependencies):
     """
     Retrieves the most common arrival date day of the week for city hotel bookings.
 
@@ -174,15 +207,16 @@ async def get_most_common_arrival_day_city(username: auth_dependencies):
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.most_common_arrival_day_city()
+    return await run_coalesced(dep.most_common_arrival_day_city, date_range)
 
 
 @router.get(
     '/count_by_hotel_meal',
     summary="Retrieves the count of bookings grouped by hotel type and meal package",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_count_by_hotel_meal(username: auth_dependencies):
+async def get_count_by_hotel_meal(username: auth_dependencies, date_range: date_range_dependencies):
     """
     Retrieves the count of bookings grouped by hotel type and meal package.
 
@@ -191,15 +225,16 @@ async def get_count_by_hotel_meal(username: auth_dependencies):
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.count_by_hotel_meal()
+    return await run_coalesced(dep.count_by_hotel_meal, date_range)
 
 
 @router.get(
     '/total_revenue_resort_by_country',
     summary="Retrieves the total revenue by country for resort hotel bookings",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_total_revenue_resort_by_country(username: auth_dependencies):
+async def get_total_revenue_resort_by_country(username: auth_dependencies, date_range: date_range_dependencies):
     """
     Retrieves the total revenue by country for resort hotel bookings.
 
@@ -208,15 +243,16 @@ async def get_total_revenue_resort_by_country(username: auth_dependencies):
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.total_revenue_resort_by_country()
+    return await run_coalesced(dep.total_revenue_resort_by_country, date_range)
 
 
 @router.get(
     '/count_by_hotel_repeated_guest',
     summary="Retrieves the count of bookings grouped by hotel type and repeated guest status",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_count_by_hotel_repeated_guest(username: auth_dependencies):
+async def get_count_by_hotel_repeated_guest(username: auth_dependencies, date_range: date_range_dependencies):
     """
     Retrieves the count of bookings grouped by hotel type and repeated guest status.
 
@@ -225,4 +261,45 @@ async def get_count_by_hotel_repeated_guest(username: auth_dependencies):
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.count_by_hotel_repeated_guest()
+    return await run_coalesced(dep.count_by_hotel_repeated_guest, date_range)
+
+
+@router.get(
+    '/nightly_occupancy',
+    summary="Retrieves the number of occupied rooms and the realized revenue per night and hotel",
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
+)
+async def get_nightly_occupancy(date_range: date_range_dependencies):
+    """
+    Retrieves the number of occupied rooms and the realized revenue per night and hotel type.
+
+    Returns the occupancy and revenue for every night (in the 'from' / 'to' period, if given) and hotel type.
+    Canceled bookings are not counted.
+    """
+    if not settings.file_uploaded:
+        raise HTTPException(status_code=400, detail="File not uploaded yet")
+
+    return await run_coalesced(dep.nightly_occupancy, date_range)
+
+
+@router.get(
+    '/cube',
+    summary="Rolls up, slices and dices the booking cube",
+    status_code=status.HTTP_200_OK,
+    dependencies=[lookup_admission]
+)
+async def get_cube(query: cube_query_dependencies):
+    """
+    Retrieves the number of bookings, nights, revenue and guests for any combination of arrival year, arrival
+    month, hotel type, country, meal package, repeated guest and cancellation status.
+
+    The answer comes from a cube precomputed when the dataset is uploaded, so it does not depend on the number
+    of bookings. Returns the measures for every combination of the `group_by` dimensions, over the bookings
+    matching the filters.
+    """
+    if not settings.file_uploaded:
+        raise HTTPException(status_code=400, detail="File not uploaded yet")
+
+    check_in_memory("The booking cube")
+    return await run_coalesced(cube.query_cube, query)
@@ -1,10 +1,20 @@
 from fastapi import APIRouter, HTTPException, Query, Path, status
-from typing import Annotated
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Annotated, Literal
+from admission import analytics_admission, lookup_admission
 from database import db_dependencies
 from app.schemas import BookingModel
-from app import db_queries
+from app import db_queries, export
+from app.formats import BOOKING_LIST_RESPONSES, accept_dependencies, booking_response, bookings_response
+from app.params import check_in_memory, date_range_dependencies
+from app.single_flight import run_coalesced
+from lazy_modules import lazy_import
 import settings
-import app.dependencies as dep
+
+dep = lazy_import('app.dependencies')
+name_index = lazy_import('app.name_index')
+sketches = lazy_import('app.sketches')
 
 router = APIRouter(
     prefix='/bookings',
@@ -16,18 +26,22 @@ router = APIRouter(
     '/',
     summary="Get a list of all bookings",
     status_code=status.HTTP_200_OK,
-    response_model=list[BookingModel]
+    response_model=list[BookingModel],
+    responses=BOOKING_LIST_RESPONSES,
+    dependencies=[lookup_admission]
 )
-async def get_bookings(
+def get_bookings(
         db: db_dependencies, skip: Annotated[int | None, Query(title="Number of values to skip",
                                                                description="Number of values to skip (from the beginning)")] = 0,
         limit: Annotated[int | None, Query(title="Limit number of entries",
-                                           description="Limit number of entries (100 is optimal)")] = 100
+                                           description="Limit number of entries (100 is optimal)")] = 100,
+        accept: accept_dependencies = None
 ):
     """
     Get a list of all bookings.
 
-    Returns a list of all bookings in the database.
+    Returns a list of all bookings in the database, as JSON rows, JSON columns or an Arrow IPC stream
+    depending on the Accept header.
 
     - **db**: Dependency to obtain a database session.
     """
@@ -35,16 +49,18 @@ async def get_bookings(
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
     bookings = db_queries.get_bookings(db, skip=skip, limit=limit)
-    return bookings
+    return bookings_response(bookings, accept)
 
 
 @router.get(
     '/search',
     summary="Search for bookings",
     status_code=status.HTTP_200_OK,
-    response_model=list[BookingModel]
+    response_model=list[BookingModel],
+    responses=BOOKING_LIST_RESPONSES,
+    dependencies=[lookup_admission]
 )
-async def search_booking(
+def search_booking(
         db: db_dependencies,
         guest_name: Annotated[
             str | None, Query(title="Name of quest", description="Name of the guest to search for")] = None,
@@ -52,12 +68,14 @@ async def search_booking(
             str | None, Query(title="Booking creating date", description="Booking date to search for", min_length=10,
                               max_length=10)] = None,
         length_of_stay: Annotated[
-            int | None, Query(title="Number of days of stay", description="Length of stay to search for", ge=0)] = None
+            int | None, Query(title="Number of days of stay", description="Length of stay to search for", ge=0)] = None,
+        accept: accept_dependencies = None
 ):
     """
     Search for bookings based on optional criteria.
 
-    Returns a list of bookings that match the specified criteria.
+    Returns a list of bookings that match the specified criteria, as JSON rows, JSON columns or an Arrow IPC
+    stream depending on the Accept header.
 
     - **guest_name**: Name of the guest to search for.
     - **book_date**: Booking date to search for.
@@ -72,15 +90,90 @@ async def search_booking(
     if not results:
         raise HTTPException(status_code=404, detail="No bookings found")
 
-    return results
+    return bookings_response(results, accept)
+
+
+@router.get(
+    '/export',
+    summary="Export bookings as CSV, NDJSON or Parquet",
+    status_code=status.HTTP_200_OK,
+    response_class=StreamingResponse,
+    dependencies=[analytics_admission]
+)
+async def export_bookings(
+        export_format: Annotated[
+            Literal['csv', 'ndjson', 'parquet'], Query(alias='format', title="Export format",
+                                                       description="Format of the exported file")] = 'csv',
+        guest_name: Annotated[
+            str | None, Query(title="Name of quest", description="Name of the guest to search for")] = None,
+        book_date: Annotated[
+            str | None, Query(title="Booking creating date", description="Booking date to search for", min_length=10,
+                              max_length=10)] = None,
+        length_of_stay: Annotated[
+            int | None, Query(title="Number of days of stay", description="Length of stay to search for", ge=0)] = None
+):
+    """
+    Export the bookings table.
+
+    Streams all bookings (optionally filtered like `/bookings/search`) encoded as CSV, NDJSON or Parquet.
+    Rows are read from the database and encoded in batches, so exports of any size run in constant memory.
+
+    - **format**: 'csv', 'ndjson' or 'parquet'.
+    - **guest_name**: Name of the guest to search for.
+    - **book_date**: Booking date to search for.
+    - **length_of_stay**: Length of stay to search for.
+    """
+    if not settings.file_uploaded:
+        raise HTTPException(status_code=400, detail="File not uploaded yet")
+
+    return StreamingResponse(
+        export.export_bookings(export_format, guest_name, book_date, length_of_stay),
+        media_type=export.MEDIA_TYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename="bookings.{export_format}"'}
+    )
+
+
+@router.get(
+    '/autocomplete',
+    summary="Look up bookings by guest name prefix or approximate name",
+    status_code=status.HTTP_200_OK,
+    response_model=list[BookingModel],
+    dependencies=[lookup_admission]
+)
+async def autocomplete_guest_name(
+        q: Annotated[str, Query(title="Guest name", description="Beginning of the guest name, or an approximate name",
+                                min_length=1)],
+        limit: Annotated[int, Query(title="Limit number of entries", description="Maximum number of bookings to return",
+                                    ge=1, le=100)] = 10,
+        fuzzy: Annotated[bool, Query(
+            title="Typo-tolerant search", description="Rank guest names by similarity instead of matching the prefix")
+        ] = False
+):
+    """
+    Look up bookings by guest name.
+
+    Returns up to `limit` bookings whose guest name starts with the query (case-insensitive),
+    or, with `fuzzy` set, whose guest name is most similar to the query.
+
+    - **q**: Beginning of the guest name, or an approximate name.
+    - **limit**: Maximum number of bookings to return.
+    - **fuzzy**: Rank guest names by similarity instead of matching the prefix.
+    """
+    if not settings.file_uploaded:
+        raise HTTPException(status_code=400, detail="File not uploaded yet")
+
+    check_in_memory("Guest name lookup")
+    # The index may still be building after a restart (see `name_index.build_in_background`)
+    return await run_in_threadpool(name_index.lookup_guest_name, q, limit=limit, fuzzy=fuzzy)
 
 
 @router.get(
     '/stats',
     summary="Provides statistical information about the dataset",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_stats():
+async def get_stats(date_range: date_range_dependencies):
     """
     Retrieve statistical information about the booking dataset.
 
@@ -92,15 +185,38 @@ async def get_stats():
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.stats_calculation()
+    return await run_coalesced(dep.stats_calculation, date_range)
+
+
+@router.get(
+    '/approximate_stats',
+    summary="Provides approximate statistical information about the dataset",
+    status_code=status.HTTP_200_OK,
+    dependencies=[lookup_admission]
+)
+async def get_approximate_stats():
+    """
+    Retrieve approximate statistical information about the booking dataset.
+
+    The values are read from sketches built when the dataset is uploaded, so they do not depend on
+    the size of the dataset. Every estimate is returned together with its error bound.
+
+    Returns a dictionary containing the number of bookings, the ten most common guest names and booking dates,
+             the number of distinct guests and percentiles of the daily rate and of the length of stay.
+    """
+    if not settings.file_uploaded:
+        raise HTTPException(status_code=400, detail="File not uploaded yet")
+
+    return await run_coalesced(sketches.approximate_stats)
 
 
 @router.get(
     '/analysis',
     summary="Performs advanced analysis on the dataset",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[analytics_admission]
 )
-async def get_analysis():
+async def get_analysis(date_range: date_range_dependencies):
     """
     Perform advanced analysis on the booking dataset.
 
@@ -113,16 +229,17 @@ async def get_analysis():
     if not settings.file_uploaded:
         raise HTTPException(status_code=400, detail="File not uploaded yet")
 
-    return dep.analysis_calculation()
+    return await run_coalesced(dep.analysis_calculation, date_range)
 
 
 @router.get(
     '/{booking_id}',
     summary="Get a booking by its ID",
     status_code=status.HTTP_200_OK,
-    response_model=BookingModel
+    response_model=BookingModel,
+    dependencies=[lookup_admission]
 )
-async def get_booking_by_id(
+def get_booking_by_id(
         booking_id: Annotated[
             int, Path(..., title="Booking ID", description="The ID of the booking to retrieve", ge=0)],
         db: db_dependencies
@@ -142,4 +259,4 @@ async def get_booking_by_id(
 
     if not booking_by_id:
         raise HTTPException(status_code=404, detail="Booking not found")
-    return booking_by_id
+    return booking_response(booking_by_id)
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+from config import settings as stt
+from app import calendar_dim, dataset
+
+# Seed of the sample draw, so the sample of a dataset is the same after a restart
+SEED = 20240101
+# Bookings drawn at least from every stratum (or all of them for smaller strata)
+MIN_STRATUM_SAMPLE = 30
+# Normal quantile of the 95% confidence intervals
+Z_95 = 1.959963984540054
+
+SAMPLE_COLUMNS = ['hotel', 'arrival_date', 'booking_date', 'arrival_date_month', 'booking_key', 'adr',
+                  'length_of_stay', 'is_canceled']
+
+# Dataset the sample was drawn from, the sample rows (with their stratum) and the population and sample
+# size of every stratum
+_source = None
+_sample = None
+_strata = None
+
+
+def build_sample(columns: dataset.LazyColumns, size: int | None = None) -> pd.DataFrame:
+    """
+    Draw a stratified random sample of the booking dataset.
+
+    The strata are the combinations of hotel type and arrival year. Every stratum gets a share of the
+    sample proportional to its number of bookings, and at least `MIN_STRATUM_SAMPLE` bookings.
+
+    :param columns: The columns of the booking dataset (see `dataset.store`); only the strata columns and
+        the `SAMPLE_COLUMNS` of the sampled rows are read.
+    :param size: Approximate number of sampled bookings (default: the `SAMPLE_SIZE` setting).
+    :return: The sampled bookings, with their stratum number in the 'stratum' column.
+    """
+    global _source, _sample, _strata
+
+    size = size or stt.SAMPLE_SIZE
+    rng = np.random.default_rng(SEED)
+    frame = columns.frame(['hotel', 'arrival_date_year'])
+
+    positions, strata, population, drawn = [], [], [], []
+    for stratum, rows in enumerate(frame.groupby(['hotel', 'arrival_date_year'], sort=True).indices.values()):
+        count = min(len(rows), max(MIN_STRATUM_SAMPLE, round(size * len(rows) / len(frame))))
+        positions.append(np.sort(rng.choice(rows, count, replace=False)))
+        strata.append(np.full(count, stratum))
+        population.append(len(rows))
+        drawn.append(count)
+
+    positions = np.concatenate(positions) if positions else np.array([], dtype=np.int64)
+    sample = columns.frame(SAMPLE_COLUMNS, positions).reset_index(drop=True)
+    sample['stratum'] = np.concatenate(strata) if strata else np.array([], dtype=np.int64)
+
+    _sample = sample
+    _strata = (np.array(population, dtype=float), np.array(drawn, dtype=float))
+    _source = columns
+    return sample
+
+
+def _ensure_sample() -> pd.DataFrame:
+    columns = dataset.store()
+    if _source is not columns:
+        build_sample(columns)
+    return _sample
+
+
+def _in_range(sample: pd.DataFrame, date_range) -> np.ndarray:
+    mask = np.ones(len(sample), dtype=bool)
+    if date_range is None:
+        return mask
+
+    values = sample['booking_date' if date_range.field == 'booking' else 'arrival_date']
+    if date_range.date_from is not None:
+        mask &= (values >= pd.Timestamp(date_range.date_from)).to_numpy()
+    if date_range.date_to is not None:
+        mask &= (values <= pd.Timestamp(date_range.date_to)).to_numpy()
+    return mask
+
+
+def _total(values: np.ndarray) -> tuple[float, float]:
+    """
+    Estimate the population total of a variable from its sampled values, with the variance of the estimate.
+    """
+    population, drawn = _strata
+    stratum = _sample['stratum'].to_numpy()
+
+    means = np.bincount(stratum, weights=values, minlength=len(drawn)) / drawn
+    squares = np.bincount(stratum, weights=values * values, minlength=len(drawn))
+    variances = np.where(drawn > 1, np.maximum(squares - drawn * means ** 2, 0) / np.maximum(drawn - 1, 1), 0.0)
+
+    total = float((population * means).sum())
+    variance = float((population ** 2 * (1 - drawn / population) * variances / drawn).sum())
+    return total, variance
+
+
+def _estimates(mask: np.ndarray, keys: list, values: np.ndarray, value_name: str, statistic: str) -> list:
+    """
+    Estimate a total or a mean of a variable for every group of bookings, with 95% confidence intervals.
+
+    Groups are domains of the population: the rows outside of a group count as zeros in every stratum,
+    and means are ratio estimates (total of the values over estimated number of bookings, linearized
+    for the variance).
+
+    :param mask: Sample rows to consider.
+    :param keys: Per-row group keys (a DataFrame with one column per key).
+    :param values: Per-row values of the variable.
+    :param value_name: Name of the estimate in the result.
+    :param statistic: 'total' or 'mean'.
+    :return: A list of dictionaries with the group keys, the estimate, 'ci_lower', 'ci_upper' and
+        'sample_size' (sampled bookings in the group).
+    """
+    selected = np.flatnonzero(mask)
+    result = []
+    for key, rows in keys.iloc[selected].groupby(list(keys.columns), sort=True).indices.items():
+        key = key if isinstance(key, tuple) else (key,)
+        member = np.zeros(len(values))
+        member[selected[rows]] = 1.0
+
+        estimate, variance = _total(values * member)
+        if statistic == 'mean':
+            count, _ = _total(member)
+            estimate = estimate / count
+            _, variance = _total((values - estimate) * member / count)
+
+        margin = Z_95 * variance ** 0.5
+        result.append({**dict(zip(keys.columns, key)), value_name: estimate, 'ci_lower': estimate - margin,
+                       'ci_upper': estimate + margin, 'sample_size': len(rows)})
+    return result
+
+
+def avg_length_of_stay(date_range=None) -> list:
+    """
+    Estimate the average length of stay per booking year and hotel from the sample.
+
+    :param date_range: An optional `DateRange` to restrict the estimate to.
+    :return: The result of `dependencies.avg_length_of_stay` with the estimated 'length_of_stay',
+        its 95% confidence interval ('ci_lower', 'ci_upper') and the 'sample_size' of each group.
+    """
+    sample = _ensure_sample()
+    keys = pd.DataFrame({'booking_date_year': calendar_dim.lookup(sample['booking_key'], 'year'),
+                         'hotel': sample['hotel']})
+    return _estimates(_in_range(sample, date_range), keys, sample['length_of_stay'].to_numpy(dtype=float),
+                      'length_of_stay', 'mean')
+
+
+def total_revenue(date_range=None) -> list:
+    """
+    Estimate the revenue of the non-canceled bookings per booking month and hotel from the sample.
+
+    :param date_range: An optional `DateRange` to restrict the estimate to.
+    :return: The result of `dependencies.total_revenue` with the estimated 'revenue', its 95% confidence
+        interval ('ci_lower', 'ci_upper') and the 'sample_size' of each group.
+    """
+    sample = _ensure_sample()
+    keys = pd.DataFrame({'booking_date_month': calendar_dim.lookup(sample['booking_key'], 'month_name'),
+                         'hotel': sample['hotel']})
+    mask = _in_range(sample, date_range) & (sample['is_canceled'] == 0).to_numpy()
+    revenue = (sample['adr'] * sample['length_of_stay']).to_numpy(dtype=float)
+    return _estimates(mask, keys, revenue, 'revenue', 'total')
+
+
+def avg_daily_rate_resort(date_range=None) -> list:
+    """
+    Estimate the average daily rate of the 'Resort Hotel' per arrival month from the sample.
+
+    :param date_range: An optional `DateRange` to restrict the estimate to.
+    :return: The result of `dependencies.avg_daily_rate_resort` with the estimated 'adr', its 95% confidence
+        interval ('ci_lower', 'ci_upper') and the 'sample_size' of each month.
+    """
+    sample = _ensure_sample()
+    keys = pd.DataFrame({'month': sample['arrival_date_month']})
+    mask = _in_range(sample, date_range) & (sample['hotel'] == 'Resort Hotel').to_numpy()
+    return _estimates(mask, keys, sample['adr'].to_numpy(dtype=float), 'adr', 'mean')
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from datetime import date
+from typing import Literal
 
 
 class BookingModel(BaseModel):
@@ -8,3 +9,27 @@ class BookingModel(BaseModel):
     booking_date: date
     length_of_stay: int
     daily_rate: float
+
+
+class DateRange(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    date_from: date | None = None
+    date_to: date | None = None
+    field: Literal['arrival', 'booking'] = 'arrival'
+
+
+CubeDimension = Literal['year', 'month', 'hotel', 'country', 'meal', 'is_repeated_guest', 'is_canceled']
+
+
+class CubeQuery(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    group_by: tuple[CubeDimension, ...] = ()
+    year: tuple[int, ...] | None = None
+    month: tuple[int, ...] | None = None
+    hotel: tuple[str, ...] | None = None
+    country: tuple[str, ...] | None = None
+    meal: tuple[str, ...] | None = None
+    is_repeated_guest: tuple[int, ...] | None = None
+    is_canceled: tuple[int, ...] | None = None
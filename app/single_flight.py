@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+from fastapi.concurrency import run_in_threadpool
+from config import settings as stt
+import settings
+
+# (module, function, arguments, dataset version) -> task computing the result
+_in_flight = {}
+# (module, function, arguments, dataset version) -> (result, approximate size in bytes), least recently used
+# first; also filled from the warm-up thread (see app/warmup.py)
+_results = OrderedDict()
+_results_size = 0
+_results_lock = threading.Lock()
+# Results larger than this share of the cache budget are not cached
+MAX_RESULT_SHARE = 0.25
+
+
+def _key(func, args: tuple, version) -> tuple:
+    return func.__module__, func.__name__, args, version
+
+
+def result_size(result) -> int:
+    """
+    Approximate the memory held by a result by the length of its JSON encoding.
+    """
+    try:
+        return len(json.dumps(result, default=str))
+    except (TypeError, ValueError):
+        return len(repr(result))
+
+
+def store_result(func, args: tuple, version, result, size: int | None = None) -> None:
+    """
+    Cache the result of an analytics function for a dataset version.
+
+    The cache holds the most recently used results up to about `RESULT_CACHE_MB` (see `result_size`); a result
+    larger than `MAX_RESULT_SHARE` of it (e.g. the bookings of a large country) is not cached.
+
+    :param size: The `result_size` of the result, if it is already known.
+    """
+    global _results_size
+
+    budget = stt.RESULT_CACHE_MB * 2 ** 20
+    size = result_size(result) if size is None else size
+    if size > budget * MAX_RESULT_SHARE:
+        return
+
+    key = _key(func, args, version)
+    with _results_lock:
+        if key in _results:
+            _results_size -= _results.pop(key)[1]
+        _results[key] = (result, size)
+        _results_size += size
+        while _results_size > budget:
+            _results_size -= _results.popitem(last=False)[1][1]
+
+
+def drop_stale_results(version) -> None:
+    """
+    Forget the cached results of every dataset version but `version`.
+    """
+    global _results_size
+
+    with _results_lock:
+        for key in [key for key in _results if key[-1] != version]:
+            _results_size -= _results.pop(key)[1]
+
+
+def _call_sized(func, args: tuple) -> tuple:
+    # The result is measured in the thread pool too, not on the event loop
+    result = func(*args)
+    return result, result_size(result)
+
+
+def _store_if_current(func, args: tuple, version, task) -> None:
+    # A result finished after the dataset was replaced is not kept
+    if not task.cancelled() and task.exception() is None and version == settings.dataset_version:
+        store_result(func, args, version, *task.result())
+
+
+async def run_coalesced(func, *args):
+    """
+    Run an analytics function in the thread pool, sharing the computation between concurrent identical calls.
+
+    Calls with the same function, arguments and dataset version that arrive while a computation is running
+    wait for that computation instead of starting their own. The computation runs in its own task, so it
+    finishes for the remaining callers even if the caller that started it disconnects. Results are cached
+    per dataset version (see `store_result`), so later identical calls are answered without computing.
+
+    :param func: The function to call; its arguments must be hashable.
+    :param args: Positional arguments for `func`.
+    :return: The result of `func(*args)`.
+    """
+    version = settings.dataset_version
+    key = _key(func, args, version)
+
+    with _results_lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key][0]
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(run_in_threadpool(_call_sized, func, args))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+        task.add_done_callback(lambda done: _store_if_current(func, args, version, done))
+
+    result, _ = await asyncio.shield(task)
+    return result
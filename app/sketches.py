@@ -0,0 +1,263 @@
+import math
+import numpy as np
+import pandas as pd
+from config import settings as stt
+from app import dataset
+import settings
+
+CHUNK_SIZE = 100_000
+# Dataset columns the sketches are built from
+SKETCH_COLUMNS = ['name', 'booking_date', 'adr', 'length_of_stay']
+
+# Dataset (or dataset version in 'chunked' mode) the sketches were built for and the sketches themselves
+_source = None
+_sketches = None
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary of the most frequent items.
+
+    Every tracked item has an estimated count and a maximum overestimation, so its true count lies in
+    [count - error, count]. Two summaries can be merged, so chunks can be summarized independently.
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self.counters = {}
+
+    def _floor(self) -> int:
+        # Count an untracked item may have had in this summary
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(item, (floor, floor))
+            other_count, other_error = other.counters.get(item, (other_floor, other_floor))
+            merged[item] = (count + other_count, error + other_error)
+
+        # Equal counts are ordered by item, so the summary does not depend on the iteration order of the set
+        top = sorted(merged.items(), key=lambda entry: (-entry[1][0], entry[0]))[:self.capacity]
+        self.counters = dict(top)
+        return self
+
+    def update(self, values: pd.Series) -> 'SpaceSaving':
+        chunk = SpaceSaving(self.capacity)
+        # Exact counts of the chunk; items dropped here count at most the smallest kept count
+        counts = values.value_counts().head(self.capacity)
+        chunk.counters = {item: (int(count), 0) for item, count in counts.items()}
+        return self.merge(chunk)
+
+    def top(self, k: int) -> list:
+        top = sorted(self.counters.items(), key=lambda entry: (-entry[1][0], entry[0]))[:k]
+        return [{'value': item, 'count': count, 'max_error': error} for item, (count, error) in top]
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count sketch with 2 ** precision registers.
+
+    The relative standard error of the estimate is 1.04 / sqrt(2 ** precision). Merging takes the
+    register-wise maximum.
+    """
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values: pd.Series) -> 'HyperLogLog':
+        hashes = pd.util.hash_pandas_object(values.dropna(), index=False).to_numpy(dtype=np.uint64)
+        tail_bits = 64 - self.precision
+        indices = (hashes >> np.uint64(tail_bits)).astype(np.intp)
+        tails = hashes & np.uint64((1 << tail_bits) - 1)
+
+        # Position of the leftmost 1-bit in the remaining bits
+        ranks = np.full(len(tails), tail_bits + 1, dtype=np.uint8)
+        nonzero = tails > 0
+        ranks[nonzero] = tail_bits - np.floor(np.log2(tails[nonzero].astype(np.float64))).astype(np.uint8)
+
+        np.maximum.at(self.registers, indices, ranks)
+        return self
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting for small cardinalities
+            return m * math.log(m / zeros)
+        return float(raw)
+
+
+class TDigest:
+    """
+    Merging t-digest for quantile estimates.
+
+    Values are kept as weighted centroids which are small near the tails and larger near the median,
+    bounded by the arcsine scale function with the given compression.
+    """
+
+    def __init__(self, compression: int = 200):
+        self.compression = compression
+        self.means = np.array([], dtype=np.float64)
+        self.weights = np.array([], dtype=np.float64)
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray) -> 'TDigest':
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        if total == 0:
+            return self
+
+        midpoints = (np.cumsum(weights) - weights / 2) / total
+        scale = self.compression / (2 * np.pi) * np.arcsin(2 * midpoints - 1)
+        _, groups = np.unique(np.floor(scale), return_inverse=True)
+
+        merged_weights = np.bincount(groups, weights=weights)
+        self.means = np.bincount(groups, weights=means * weights) / merged_weights
+        self.weights = merged_weights
+        return self
+
+    def update(self, values: pd.Series) -> 'TDigest':
+        values = values.dropna().to_numpy(dtype=np.float64)
+        return self._compress(np.concatenate([self.means, values]),
+                              np.concatenate([self.weights, np.ones(len(values))]))
+
+    def merge(self, other: 'TDigest') -> 'TDigest':
+        return self._compress(np.concatenate([self.means, other.means]),
+                              np.concatenate([self.weights, other.weights]))
+
+    def quantile(self, q: float) -> dict:
+        total = self.weights.sum()
+        if total == 0:
+            return {'quantile': q, 'value': None, 'max_rank_error': None}
+
+        midpoints = (np.cumsum(self.weights) - self.weights / 2) / total
+        value = float(np.interp(q, midpoints, self.means))
+        # The rank of an interpolated value is uncertain by at most half of the nearest centroid's weight
+        nearest = min(int(np.searchsorted(midpoints, q)), len(midpoints) - 1)
+        return {'quantile': q, 'value': value, 'max_rank_error': float(self.weights[nearest] / total / 2)}
+
+
+def summarize_chunk(chunk: pd.DataFrame) -> dict:
+    """
+    Build the sketches for one chunk of the booking dataset.
+
+    :param chunk: Rows of the booking dataset.
+    :return: A dictionary of sketches that can be combined with `merge_sketches`.
+    """
+    return {
+        'rows': len(chunk),
+        'guest_names': SpaceSaving().update(chunk['name']),
+        'booking_dates': SpaceSaving().update(chunk['booking_date']),
+        'distinct_guests': HyperLogLog().update(chunk['name']),
+        'daily_rate': TDigest().update(chunk['adr']),
+        'length_of_stay': TDigest().update(chunk['length_of_stay']),
+    }
+
+
+def merge_sketches(left: dict, right: dict) -> dict:
+    """
+    Combine the sketches of two chunks into the sketches of both.
+
+    :param left: Sketches returned by `summarize_chunk` or `merge_sketches` (updated in place).
+    :param right: Sketches to merge into `left`.
+    :return: The merged sketches.
+    """
+    left['rows'] += right['rows']
+    for name in ('guest_names', 'booking_dates', 'distinct_guests', 'daily_rate', 'length_of_stay'):
+        left[name].merge(right[name])
+    return left
+
+
+def build_sketches(columns: dataset.LazyColumns, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Summarize the booking dataset chunk by chunk into mergeable sketches.
+
+    :param columns: The columns of the booking dataset (see `dataset.store`); only the `SKETCH_COLUMNS` are read.
+    :param chunk_size: Number of rows summarized at a time.
+    :return: The sketches of the whole dataset.
+    """
+    global _source, _sketches
+
+    frame = columns.frame(SKETCH_COLUMNS)
+    sketches = summarize_chunk(frame.iloc[:0])
+    for start in range(0, len(frame), chunk_size):
+        merge_sketches(sketches, summarize_chunk(frame.iloc[start:start + chunk_size]))
+
+    _sketches = sketches
+    _source = columns
+    return sketches
+
+
+def build_sketches_chunked() -> dict:
+    """
+    Summarize the saved csv file into mergeable sketches, chunk by chunk (see `chunked.read_chunks`), without
+    loading it into memory.
+
+    :return: The sketches of the whole dataset.
+    """
+    global _source, _sketches
+
+    # Imported here, the chunked module depends on this one
+    from app import chunked
+
+    sketches = summarize_chunk(pd.DataFrame(columns=SKETCH_COLUMNS))
+    for chunk in chunked.read_chunks(['name', 'adr']):
+        merge_sketches(sketches, summarize_chunk(chunk))
+
+    _sketches = sketches
+    _source = settings.dataset_version
+    return sketches
+
+
+def approximate_stats() -> dict:
+    """
+    Calculate approximate statistics from the sketches of the booking dataset.
+
+    Returns a dictionary containing the following statistics:
+
+    - 'number_of_bookings': Total number of bookings in the dataset.
+    - 'ten_most_common_guests': Ten most common guest names with estimated counts and maximum overestimation.
+    - 'ten_most_popular_dates': Ten most popular booking dates with estimated counts and maximum overestimation.
+    - 'distinct_guests': Estimated number of distinct guest names with its relative standard error.
+    - 'daily_rate_percentiles': Estimated percentiles of the daily rate with their maximum rank error.
+    - 'length_of_stay_percentiles': Estimated percentiles of the length of stay with their maximum rank error.
+    """
+    if stt.ANALYTICS_MODE == 'chunked':
+        sketches = _sketches if _source == settings.dataset_version else build_sketches_chunked()
+    else:
+        columns = dataset.store()
+        sketches = _sketches if _source is columns else build_sketches(columns)
+    quantiles = (0.5, 0.9, 0.95, 0.99)
+
+    popular_dates = sketches['booking_dates'].top(10)
+    for entry in popular_dates:
+        entry['value'] = entry['value'].strftime('%Y-%m-%d')
+
+    distinct = sketches['distinct_guests']
+
+    return {
+        'number_of_bookings': sketches['rows'],
+        'ten_most_common_guests': sketches['guest_names'].top(10),
+        'ten_most_popular_dates': popular_dates,
+        'distinct_guests': {
+            'estimate': round(distinct.estimate()),
+            'relative_standard_error': distinct.relative_error
+        },
+        'daily_rate_percentiles': [sketches['daily_rate'].quantile(q) for q in quantiles],
+        'length_of_stay_percentiles': [sketches['length_of_stay'].quantile(q) for q in quantiles],
+    }
@@ -0,0 +1,141 @@
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from config import settings as stt
+from app import dataset
+
+SNAPSHOT_DIR = 'app/data/snapshots'
+MANIFEST_PATH = os.path.join(SNAPSHOT_DIR, 'manifest.json')
+
+
+def read_manifest() -> dict:
+    """
+    Read the snapshot manifest.
+
+    :return: The manifest: 'current' (version of the dataset to serve) and 'versions' (snapshot entries,
+        oldest first). An empty manifest if there is none yet.
+    """
+    if not os.path.exists(MANIFEST_PATH):
+        return {'current': None, 'versions': []}
+    with open(MANIFEST_PATH) as file:
+        return json.load(file)
+
+
+def _write_manifest(manifest: dict) -> None:
+    temporary_path = MANIFEST_PATH + '.tmp'
+    with open(temporary_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temporary_path, MANIFEST_PATH)
+
+
+def _save_columns(frame: pd.DataFrame, directory: str) -> dict:
+    columns = {}
+    for position, name in enumerate(frame.columns):
+        series = frame[name]
+        path = os.path.join(directory, f'{position}.npy')
+
+        if pd.api.types.is_datetime64_any_dtype(series):
+            np.save(path, series.to_numpy(dtype='datetime64[ns]').view(np.int64))
+            columns[name] = {'file': f'{position}.npy', 'kind': 'datetime'}
+        elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            np.save(path, series.to_numpy())
+            columns[name] = {'file': f'{position}.npy', 'kind': 'numeric'}
+        else:
+            # Text columns are stored as category codes (-1 for missing values) and the list of categories
+            categorical = pd.Categorical(series)
+            np.save(path, categorical.codes)
+            columns[name] = {'file': f'{position}.npy', 'kind': 'text',
+                             'categories': [str(category) for category in categorical.categories]}
+    return columns
+
+
+def save_snapshot(frame: pd.DataFrame | None, version: str, fingerprint: str, data_path: str | None = None) -> dict:
+    """
+    Save the processed dataset as a versioned snapshot and make it the current one.
+
+    Every column is written as a .npy file (text columns as category codes) next to the ordering by booking
+    date, so a restart memory-maps the files instead of parsing and processing the csv file again.
+    Only the last `SNAPSHOT_RETENTION` snapshots are kept.
+
+    :param frame: The dataset as returned by `dataset.build_dataset`, or None when the dataset is not held
+        in memory ('chunked' mode); then only the version is recorded.
+    :param version: The dataset version.
+    :param fingerprint: SHA-256 of the csv file the dataset was built from.
+    :param data_path: Path of the retained copy of that csv file.
+    :return: The manifest entry of the snapshot.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    entry = {
+        'version': version,
+        'fingerprint': fingerprint,
+        'data_path': data_path,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'rows': None,
+        'raw_columns': None,
+        'columns': None,
+    }
+
+    if frame is not None:
+        directory = os.path.join(SNAPSHOT_DIR, version)
+        temporary_directory = directory + '.tmp'
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+        os.makedirs(temporary_directory)
+
+        entry['columns'] = _save_columns(frame, temporary_directory)
+        np.save(os.path.join(temporary_directory, 'booking_order.npy'), dataset.booking_order())
+        entry['rows'] = len(frame)
+        entry['raw_columns'] = dataset.raw_columns()
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(temporary_directory, directory)
+
+    manifest = read_manifest()
+    versions = [existing for existing in manifest['versions'] if existing['version'] != version] + [entry]
+    retained = versions[-stt.SNAPSHOT_RETENTION:]
+    manifest = {'current': version, 'versions': retained}
+    _write_manifest(manifest)
+
+    for removed in versions[:-stt.SNAPSHOT_RETENTION]:
+        shutil.rmtree(os.path.join(SNAPSHOT_DIR, removed['version']), ignore_errors=True)
+
+    return entry
+
+
+def load_snapshot(entry: dict) -> None:
+    """
+    Load a snapshot into the in-memory dataset.
+
+    The column files are memory-mapped and nothing else is read until a column is used: numeric and date
+    columns are read from the mapped files and text columns are decoded from their category codes, only for
+    the rows asked for (see `dataset.LazyColumns`).
+
+    :param entry: Manifest entry of the snapshot.
+    """
+    directory = os.path.join(SNAPSHOT_DIR, entry['version'])
+    sources = {}
+    for name, column in entry['columns'].items():
+        values = np.load(os.path.join(directory, column['file']), mmap_mode='r')
+        if column['kind'] == 'datetime':
+            sources[name] = values.view('datetime64[ns]')
+        elif column['kind'] == 'text':
+            # Code -1 (missing value) picks the trailing NaN
+            sources[name] = (values, np.array(column['categories'] + [np.nan], dtype=object))
+        else:
+            sources[name] = values
+
+    booking_order = np.load(os.path.join(directory, 'booking_order.npy'), mmap_mode='r')
+    dataset.restore_dataset(dataset.LazyColumns(entry['rows'], sources), entry['raw_columns'], booking_order)
+
+
+def current_snapshot() -> dict | None:
+    """
+    Return the manifest entry of the current snapshot, if any.
+    """
+    manifest = read_manifest()
+    for entry in manifest['versions']:
+        if entry['version'] == manifest['current']:
+            return entry
+    return None
@@ -0,0 +1,133 @@
+import inspect
+import logging
+import threading
+import time
+from config import settings as stt
+from app import cube, dataset, dependencies, name_index, sampling, sketches
+from app.schemas import DateRange
+from app.single_flight import drop_stale_results, store_result
+import settings
+import startup
+
+logger = logging.getLogger('uvicorn.error')
+
+# Progress of the last ingestion: 'idle', 'warming', 'ready' or 'failed' (the bookings could not be saved),
+# the version being (or last) loaded, the number of warmed results, the warm-up duration in seconds and the
+# partitions of the bookings table reloaded and left unchanged by the switch
+status = {'state': 'idle', 'dataset_version': None, 'fingerprint': None, 'warmed': 0, 'failed': [],
+          'warm_up_seconds': None, 'partitions_reloaded': [], 'partitions_unchanged': []}
+
+# Ingestions switch the served dataset one at a time, in the order they were uploaded
+_lock = threading.Lock()
+
+
+def analytics() -> list:
+    """
+    Return the analytics of `app.dependencies` that take a date range, i.e. those served by the dashboard
+    endpoints, as (name, function) pairs.
+    """
+    return [(name, func) for name, func in inspect.getmembers(dependencies, inspect.isfunction)
+            if func.__module__ == dependencies.__name__ and 'date_range' in inspect.signature(func).parameters]
+
+
+def warm_results(version: str) -> tuple[int, list]:
+    """
+    Compute every analytic over the whole dataset and cache the results for a dataset version.
+
+    The arguments are those of an endpoint called without a date range, so the first dashboard load is
+    answered from the cache.
+
+    :param version: Dataset version the results are cached for.
+    :return: The number of cached results and the names of the analytics that failed.
+    """
+    warmed, failed = 0, []
+    args = (DateRange(),)
+    for name, func in analytics():
+        try:
+            store_result(func, args, version, func(*args))
+            warmed += 1
+        except Exception as error:
+            logger.warning("Warm-up of %s failed: %r", name, error)
+            failed.append(name)
+    return warmed, failed
+
+
+def switch_dataset(state: tuple | None, bookings: tuple, version: str, fingerprint: str) -> tuple[list, list]:
+    """
+    Serve a new dataset version.
+
+    Saves the bookings into the bookings table, installs the dataset (when it is held in memory) and rebuilds
+    the lookup structures from it, then switches the version the endpoints and the result cache are keyed on.
+    The database endpoints serve the new bookings from the end of the write on, the analytics right after it;
+    while the changed partitions are being reloaded (one transaction each), the database endpoints may
+    already see some of them. If the write fails, the previous version keeps being served.
+
+    :param state: The dataset state (see `dataset.prepare_dataset`), or None in 'chunked' mode.
+    :param bookings: The rows of the bookings table and their booking dates (see `startup.prepare_bookings`).
+    :param version: The dataset version.
+    :param fingerprint: SHA-256 of the csv file the dataset was built from.
+    :return: The names of the reloaded partitions and the names of the unchanged ones.
+    """
+    partitions = startup.save_partitions(*bookings)
+
+    if state is not None:
+        dataset.install_dataset(state)
+        columns = dataset.store()
+        name_index.build_name_index(columns)
+        sketches.build_sketches(columns)
+        cube.build_cube(columns)
+        sampling.build_sample(columns)
+
+    settings.file_uploaded = True
+    settings.dataset_fingerprint = fingerprint
+    settings.dataset_version = version
+    drop_stale_results(version)
+    return partitions
+
+
+def start(version: str, fingerprint: str) -> dict:
+    """
+    Mark an ingestion as warming up.
+
+    :return: A copy of the ingestion status.
+    """
+    status.update(state='warming', dataset_version=version, fingerprint=fingerprint, warmed=0, failed=[],
+                  warm_up_seconds=None, partitions_reloaded=[], partitions_unchanged=[])
+    return dict(status)
+
+
+def ingest(state: tuple | None, bookings: tuple, version: str, fingerprint: str) -> None:
+    """
+    Warm the result cache for a new dataset version and switch the endpoints to it (see `switch_dataset`).
+
+    With the dataset held in memory ('memory' mode), the results are computed on the new dataset before it is
+    installed, and the endpoints (the database ones included) keep serving the previous version until the
+    switch. In 'chunked' and 'parallel' modes the analytics read the dataset from files or worker processes,
+    so the switch comes first and the cache is warmed right after it.
+
+    :param state: The dataset state (see `dataset.prepare_dataset`), or None in 'chunked' mode.
+    :param bookings: The rows of the bookings table and their booking dates (see `startup.prepare_bookings`).
+    :param version: The dataset version.
+    :param fingerprint: SHA-256 of the csv file the dataset was built from.
+    """
+    with _lock:
+        started = time.perf_counter()
+        try:
+            if state is not None and stt.ANALYTICS_MODE == 'memory':
+                with dataset.using(state):
+                    warmed, failed = warm_results(version)
+                reloaded, unchanged = switch_dataset(state, bookings, version, fingerprint)
+            else:
+                reloaded, unchanged = switch_dataset(state, bookings, version, fingerprint)
+                warmed, failed = warm_results(version)
+        except Exception as error:
+            logger.error("Dataset %s not served, its bookings could not be saved: %r", version, error)
+            if status['dataset_version'] == version:
+                status.update(state='failed')
+            return
+
+        if status['dataset_version'] == version:
+            status.update(state='ready', warmed=warmed, failed=failed,
+                          warm_up_seconds=time.perf_counter() - started, partitions_reloaded=reloaded,
+                          partitions_unchanged=unchanged)
+        logger.info("Dataset %s served, %d results warmed in %.3fs", version, warmed, time.perf_counter() - started)
@@ -2,6 +2,7 @@ from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import Annotated
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from config import settings as stt
 from database import get_db
 from user import db_queries
 
@@ -21,3 +22,15 @@ def verify_credentials(credentials: Annotated[HTTPBasicCredentials, Depends(secu
 
 
 auth_dependencies = Annotated[HTTPBasicCredentials, Depends(verify_credentials)]
+
+
+def verify_admin(user: Annotated[HTTPBasicCredentials, Depends(verify_credentials)]):
+    if user.username not in stt.ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f'User {user.username} is not an administrator'
+        )
+    return user
+
+
+admin_dependencies = Annotated[HTTPBasicCredentials, Depends(verify_admin)]
@@ -0,0 +1,56 @@
+import argparse
+import json
+import time
+from database import Session, engine
+from app import db_queries, formats, models
+from app.schemas import BookingModel
+
+
+def orm_page(db, skip: int, limit: int) -> bytes:
+    """
+    The ORM read path: Booking objects validated into `BookingModel` and encoded as JSON rows.
+    """
+    bookings = db.query(models.Booking).offset(skip).limit(limit).all()
+    return json.dumps([BookingModel.model_validate(booking, from_attributes=True).model_dump(mode='json')
+                       for booking in bookings]).encode()
+
+
+def core_page(db, skip: int, limit: int) -> bytes:
+    """
+    The Core read path: plain row tuples encoded as JSON rows.
+    """
+    bookings = db_queries.get_bookings(db, skip=skip, limit=limit)
+    return formats.bookings_response(bookings, formats.JSON_ROWS).body
+
+
+def measure(read_page, page_size: int, repeat: int) -> float:
+    """
+    Return the median time (in milliseconds) of reading and encoding one page of bookings.
+    """
+    timings = []
+    for _ in range(repeat):
+        with Session() as db:
+            started = time.perf_counter()
+            read_page(db, 0, page_size)
+            timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ORM and Core read paths of /bookings/")
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[100, 1000, 10000], help="Page sizes to measure")
+    parser.add_argument('--repeat', type=int, default=20, help="Measurements per page size and read path")
+    args = parser.parse_args()
+
+    # Keep the statement echo of the engine out of the measurement
+    engine.echo = False
+
+    print(f"{'page size':>9} {'orm ms':>9} {'core ms':>9} {'speedup':>8}")
+    for page_size in args.page_sizes:
+        orm = measure(orm_page, page_size, args.repeat)
+        core = measure(core_page, page_size, args.repeat)
+        print(f"{page_size:>9} {orm:>9.2f} {core:>9.2f} {orm / core:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import calendar
+import json
+import math
+import numbers
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from app import dataset, dependencies, parallel
+
+ANALYTICS = ['total_revenue', 'total_revenue_resort_by_country', 'count_by_hotel_meal', 'analysis_calculation']
+
+
+def synthetic_bookings(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generate a booking csv-like DataFrame with the columns used by the analytics.
+
+    :param rows: Number of bookings.
+    :param seed: Seed of the random generator.
+    :return: The DataFrame.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'hotel': rng.choice(['Resort Hotel', 'City Hotel'], rows),
+        'is_canceled': rng.integers(0, 2, rows),
+        'lead_time': rng.integers(0, 400, rows),
+        'arrival_date_year': rng.integers(2015, 2018, rows),
+        'arrival_date_month': rng.choice(calendar.month_name[1:], rows),
+        'arrival_date_day_of_month': rng.integers(1, 29, rows),
+        'stays_in_weekend_nights': rng.integers(0, 4, rows),
+        'stays_in_week_nights': rng.integers(0, 10, rows),
+        'adults': rng.integers(1, 4, rows),
+        'children': rng.integers(0, 3, rows).astype(float),
+        'babies': rng.integers(0, 2, rows),
+        'meal': rng.choice(['BB', 'HB', 'FB', 'SC', 'Undefined'], rows),
+        'country': rng.choice(['PRT', 'GBR', 'FRA', 'ESP', 'DEU', 'ITA', 'IRL', 'BEL', 'BRA', 'NLD'], rows),
+        'is_repeated_guest': rng.integers(0, 2, rows),
+        'adr': rng.gamma(4.0, 25.0, rows).round(2),
+        'name': rng.choice([f'Guest {i}' for i in range(10000)], rows),
+    })
+
+
+def relative_difference(expected, actual) -> float:
+    """
+    Return the largest relative difference between the numbers of two results of the same structure
+    (inf if the structures differ).
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        if expected.keys() != actual.keys():
+            return math.inf
+        return max((relative_difference(expected[key], actual[key]) for key in expected), default=0.0)
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return math.inf
+        return max((relative_difference(left, right) for left, right in zip(expected, actual)), default=0.0)
+    if isinstance(expected, numbers.Real) and isinstance(actual, numbers.Real):
+        if math.isnan(expected) or math.isnan(actual):
+            return 0.0 if math.isnan(expected) and math.isnan(actual) else math.inf
+        return abs(actual - expected) / max(abs(expected), abs(actual), 1e-12)
+    return 0.0 if expected == actual else math.inf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark partitioned analytics across worker counts")
+    parser.add_argument('--rows', type=int, default=2_000_000, help="Number of synthetic bookings")
+    parser.add_argument('--csv', help="Use this booking csv file instead of synthetic data")
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}), help="Worker counts to measure")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.csv:
+            dataset.DATA_PATH = args.csv
+        else:
+            dataset.DATA_PATH = os.path.join(directory, 'bookings.csv')
+            synthetic_bookings(args.rows).to_csv(dataset.DATA_PATH, index=False)
+
+        dataset.build_dataset(pd.read_csv(dataset.DATA_PATH))
+        print(f"{len(dataset.get_dataset())} bookings, block size {parallel.BLOCK_SIZE}")
+        print(f"{'analytic':<35} {'workers':>7} {'seconds':>9} {'speedup':>8} {'identical':>9} "
+              f"{'vs memory':>10}")
+
+        for name in ANALYTICS:
+            # The 'memory' mode result: the analytic itself, with pandas over the whole dataset
+            expected = getattr(dependencies, name).__wrapped__(None)
+            baseline = None
+            for workers in args.workers:
+                # Start the pool (and load the dataset in the workers) outside of the measurement
+                parallel.compute(name, None, workers=workers)
+
+                started = time.perf_counter()
+                result = parallel.compute(name, None, workers=workers)
+                elapsed = time.perf_counter() - started
+
+                encoded = json.dumps(result, sort_keys=True, default=str)
+                if baseline is None:
+                    baseline = (encoded, elapsed)
+                print(f"{name:<35} {workers:>7} {elapsed:>9.3f} {baseline[1] / elapsed:>8.2f} "
+                      f"{str(encoded == baseline[0]):>9} {relative_difference(expected, result):>10.2e}")
+
+        parallel.shutdown_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import time
+from sqlalchemy import create_engine, select
+from config import settings as stt
+from database import Session, limit_prepared_statements, statement_cache_stats, track_statement_cache
+from app import db_queries, models
+from user import db_queries as user_db_queries
+from user import models as user_models
+
+
+def hot_queries(db) -> dict:
+    """
+    Return the hot lookup queries, called with values taken from the database.
+    """
+    booking = db.execute(select(models.Booking.id, models.Booking.guest_name).limit(1)).first()
+    username = db.execute(select(user_models.User.username).limit(1)).scalar()
+
+    queries = {
+        'get_booking_by_id': lambda: db_queries.get_booking_by_id(db, booking.id),
+        'search_booking': lambda: db_queries.search_booking(db, booking.guest_name, None, None),
+    }
+    if username is not None:
+        queries['get_user_by_username'] = lambda: user_db_queries.get_user_by_username(db, username)
+    return queries
+
+
+def measure(prepare_threshold: int | None, repeat: int) -> dict:
+    """
+    Return the median latency (in milliseconds) of every hot query on a connection with the given
+    prepare threshold.
+    """
+    engine = create_engine(stt.DATABASE_URL_psycopg, connect_args={'prepare_threshold': prepare_threshold})
+    limit_prepared_statements(engine)
+    track_statement_cache(engine)
+
+    latencies = {}
+    with Session(bind=engine) as db:
+        for name, query in hot_queries(db).items():
+            # Warm up the statement cache (and the server-side prepared statement, if any)
+            for _ in range(3):
+                query()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                query()
+                timings.append((time.perf_counter() - started) * 1000)
+            latencies[name] = sorted(timings)[len(timings) // 2]
+    engine.dispose()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the hot lookup queries with and without prepared statements")
+    parser.add_argument('--repeat', type=int, default=1000, help="Executions per query")
+    args = parser.parse_args()
+
+    statement_cache_stats.clear()
+    unprepared = measure(None, args.repeat)
+    prepared = measure(0, args.repeat)
+
+    print(f"{'query':<22} {'unprepared ms':>14} {'prepared ms':>12} {'speedup':>8}")
+    for name in unprepared:
+        print(f"{name:<22} {unprepared[name]:>14.3f} {prepared[name]:>12.3f} {unprepared[name] / prepared[name]:>8.2f}")
+    print(f"Compiled statement cache: {dict(statement_cache_stats)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,14 @@
-from sqlalchemy import create_engine
+import hashlib
+from collections import Counter
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import default
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from fastapi import Depends
 from typing import Annotated
 from config import settings
+from slow_queries import track_slow_queries
 # For SQLite DB
 
 # import config
@@ -17,10 +22,50 @@ from config import settings
 engine = create_engine(
     url=settings.DATABASE_URL_psycopg,
     echo=True,
+    # Repeated statements (booking and user lookups) run as server-side prepared statements
+    connect_args={'prepare_threshold': settings.DB_PREPARE_THRESHOLD},
     # pool_size=5,
     # max_overflow=10
 )
 
+CACHE_STATES = {
+    default.CACHE_HIT: 'hit',
+    default.CACHE_MISS: 'miss',
+    default.CACHING_DISABLED: 'disabled',
+    default.NO_CACHE_KEY: 'no_cache_key',
+    default.NO_DIALECT_SUPPORT: 'no_dialect_support',
+}
+
+# Number of executed statements by use of the SQLAlchemy compiled statement cache ('hit', 'miss', ...)
+statement_cache_stats = Counter()
+
+
+def track_statement_cache(target_engine) -> None:
+    """
+    Count the executions of an engine by use of the compiled statement cache in `statement_cache_stats`.
+    """
+    @event.listens_for(target_engine, 'after_cursor_execute')
+    def count_cache_use(conn, cursor, statement, parameters, context, executemany):
+        statement_cache_stats[CACHE_STATES.get(getattr(context, 'cache_hit', None), 'no_cache_key')] += 1
+
+
+def limit_prepared_statements(target_engine) -> None:
+    """
+    Set the number of prepared statements kept per connection (`DB_PREPARED_MAX`) on the new connections of
+    an engine.
+
+    psycopg only accepts it as a connection attribute; as a connect argument it would be passed to libpq as an
+    unknown connection option.
+    """
+    @event.listens_for(target_engine, 'connect')
+    def set_prepared_max(dbapi_connection, connection_record):
+        dbapi_connection.prepared_max = settings.DB_PREPARED_MAX
+
+
+limit_prepared_statements(engine)
+track_statement_cache(engine)
+track_slow_queries(engine)
+
 Session = sessionmaker(bind=engine)
 
 Base = declarative_base()
@@ -53,3 +98,40 @@ def get_db() -> Session:
 
 
 db_dependencies = Annotated[Session, Depends(get_db)]
+
+SCHEMA_LOCK_ID = 7355608
+
+
+def schema_fingerprint() -> str:
+    """
+    Compute a fingerprint of the tables declared on `Base`.
+
+    Returns the SHA-256 hex digest of the CREATE TABLE statements of all tables.
+    """
+    ddl = ''.join(str(CreateTable(table).compile(engine)) for table in Base.metadata.sorted_tables)
+    return hashlib.sha256(ddl.encode()).hexdigest()
+
+
+def ensure_schema() -> bool:
+    """
+    Create the missing tables, once per schema version.
+
+    The fingerprint of the declared tables is stored in the 'schema_version' table. A worker whose
+    fingerprint is already stored skips `create_all` (one cheap query instead of inspecting every table).
+    An advisory lock keeps concurrently starting workers from checking the schema at the same time.
+
+    Returns True if `create_all` was run, False if the schema was already up to date.
+    """
+    fingerprint = schema_fingerprint()
+
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {'lock_id': SCHEMA_LOCK_ID})
+        connection.execute(text("CREATE TABLE IF NOT EXISTS schema_version (fingerprint VARCHAR PRIMARY KEY)"))
+        if connection.execute(text("SELECT 1 FROM schema_version WHERE fingerprint = :fingerprint"),
+                              {'fingerprint': fingerprint}).first():
+            return False
+
+        Base.metadata.create_all(connection)
+        connection.execute(text("INSERT INTO schema_version (fingerprint) VALUES (:fingerprint)"),
+                           {'fingerprint': fingerprint})
+    return True
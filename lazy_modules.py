@@ -0,0 +1,24 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name: str):
+    """
+    Import a module lazily.
+
+    The module object is returned right away, but its code only runs on the first attribute access.
+    Used to keep heavy modules (pandas, the analytics) out of application startup.
+
+    :param name: Full name of the module, e.g. 'app.dependencies'.
+    :return: The module.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import math
+import random
+import time
+from collections import defaultdict
+import httpx
+import yaml
+
+
+def load_scenario(path: str) -> dict:
+    """
+    Load a load-test scenario from a YAML file.
+
+    :param path: Path to the scenario file (see loadtest/scenarios/mixed.yaml for the format).
+    :return: The scenario with defaults filled in.
+    """
+    with open(path) as file:
+        scenario = yaml.safe_load(file)
+
+    scenario.setdefault('duration', 30)
+    scenario.setdefault('concurrency', 10)
+    scenario.setdefault('users', [])
+    for request in scenario['requests']:
+        request.setdefault('method', 'GET')
+        request.setdefault('params', {})
+        request.setdefault('vars', {})
+        request.setdefault('weight', 1)
+        request.setdefault('auth', False)
+    return scenario
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values.
+
+    :param sorted_values: Values in ascending order.
+    :param p: Percentile between 0 and 100.
+    :return: The percentile, or NaN for no values.
+    """
+    if not sorted_values:
+        return math.nan
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def draw(spec):
+    """
+    Draw a value of a request variable.
+
+    :param spec: `[low, high]` for an integer in that range, or a dict whose 'values' were fetched by `_setup`
+        (see `fetch_values`).
+    :return: The value.
+    """
+    if isinstance(spec, dict):
+        return random.choice(spec['values'])
+    low, high = spec
+    return random.randint(low, high)
+
+
+async def fetch_values(client: httpx.AsyncClient, spec: dict) -> list:
+    """
+    Fetch the values of a request variable from the application, e.g. the ids of existing bookings.
+
+    :param client: The HTTP client.
+    :param spec: `{from: path, params: query parameters, field: name}`; the path must return a JSON list of
+        objects, and the variable takes the values of their `field`.
+    :return: The values.
+    """
+    response = await client.get(spec['from'], params=spec.get('params', {}))
+    response.raise_for_status()
+    values = [row[spec['field']] for row in response.json()]
+    if not values:
+        raise ValueError(f"No values for {spec['field']} at {spec['from']}")
+    return values
+
+
+def _render(template, values: dict):
+    if isinstance(template, str):
+        return template.format(**values)
+    return template
+
+
+async def _send(client: httpx.AsyncClient, request: dict, users: list):
+    values = {name: draw(spec) for name, spec in request['vars'].items()}
+    params = {key: _render(value, values) for key, value in request['params'].items()}
+    auth = None
+    if request['auth'] and users:
+        user = random.choice(users)
+        auth = (user['username'], user['password'])
+
+    files = None
+    if 'upload' in request:
+        files = {'csv_file': open(request['upload'], 'rb')}
+    try:
+        return await client.request(request['method'], request['path'].format(**values), params=params,
+                                    auth=auth, files=files)
+    finally:
+        if files:
+            files['csv_file'].close()
+
+
+async def _setup(client: httpx.AsyncClient, scenario: dict) -> None:
+    for user in scenario['users']:
+        # 400 means the user already exists
+        await client.post('/users/', json=user)
+
+    if scenario.get('upload'):
+        with open(scenario['upload'], 'rb') as file:
+            response = await client.post('/upload-and-process-csv', files={'csv_file': file})
+        response.raise_for_status()
+        # The bookings are saved and served once the warm-up of the upload is over
+        while (await client.get('/upload-status')).json()['warm_up']['state'] == 'warming':
+            await asyncio.sleep(1)
+
+    for request in scenario['requests']:
+        for spec in request['vars'].values():
+            if isinstance(spec, dict):
+                spec['values'] = await fetch_values(client, spec)
+
+
+async def _client_loop(client: httpx.AsyncClient, scenario: dict, deadline: float, results: dict) -> None:
+    requests = scenario['requests']
+    weights = [request['weight'] for request in requests]
+
+    while time.perf_counter() < deadline:
+        request = random.choices(requests, weights=weights)[0]
+        started = time.perf_counter()
+        try:
+            response = await _send(client, request, scenario['users'])
+            failed = response.status_code >= 500 or response.status_code == 429
+        except httpx.HTTPError:
+            failed = True
+        elapsed = time.perf_counter() - started
+
+        stats = results[request['name']]
+        stats['latencies'].append(elapsed)
+        stats['errors'] += failed
+
+
+async def run(scenario: dict, base_url: str) -> dict:
+    """
+    Run a scenario against a running application.
+
+    :param scenario: Scenario as returned by `load_scenario`.
+    :param base_url: Base URL of the application, e.g. 'http://127.0.0.1:8000'.
+    :return: Per request name: the list of latencies (seconds) and the number of failed requests.
+    """
+    results = defaultdict(lambda: {'latencies': [], 'errors': 0})
+    limits = httpx.Limits(max_connections=scenario['concurrency'])
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=scenario.get('timeout', 60), limits=limits) as client:
+        await _setup(client, scenario)
+
+        deadline = time.perf_counter() + scenario['duration']
+        await asyncio.gather(*(_client_loop(client, scenario, deadline, results)
+                               for _ in range(scenario['concurrency'])))
+
+    return dict(results)
+
+
+def report(results: dict, duration: float) -> str:
+    """
+    Format the results of a run as a table of throughput and latency percentiles per request name.
+
+    :param results: Results returned by `run`.
+    :param duration: Duration of the run in seconds.
+    :return: The table as text.
+    """
+    lines = [f"{'request':<45} {'count':>7} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+    all_latencies = []
+    all_errors = 0
+
+    for name, stats in sorted(results.items()):
+        latencies = sorted(stats['latencies'])
+        all_latencies.extend(latencies)
+        all_errors += stats['errors']
+        lines.append(f"{name:<45} {len(latencies):>7} {stats['errors']:>7} {len(latencies) / duration:>8.1f} "
+                     f"{percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 95) * 1000:>9.1f} "
+                     f"{percentile(latencies, 99) * 1000:>9.1f}")
+
+    all_latencies.sort()
+    lines.append(f"{'total':<45} {len(all_latencies):>7} {all_errors:>7} {len(all_latencies) / duration:>8.1f} "
+                 f"{percentile(all_latencies, 50) * 1000:>9.1f} {percentile(all_latencies, 95) * 1000:>9.1f} "
+                 f"{percentile(all_latencies, 99) * 1000:>9.1f}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a load-test scenario against the booking API")
+    parser.add_argument('scenario', help="Path to the scenario YAML file")
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000', help="Base URL of the running application")
+    parser.add_argument('--duration', type=float, help="Override the scenario duration (seconds)")
+    parser.add_argument('--concurrency', type=int, help="Override the number of simultaneous clients")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    if args.duration is not None:
+        scenario['duration'] = args.duration
+    if args.concurrency is not None:
+        scenario['concurrency'] = args.concurrency
+
+    results = asyncio.run(run(scenario, args.base_url))
+    print(report(results, scenario['duration']))
+
+
+if __name__ == '__main__':
+    main()
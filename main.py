@@ -1,80 +1,193 @@
-import pandas as pd
+import time
+
+_import_started = time.perf_counter()
+
 import config
+import logging
 import uvicorn
-import atexit
 import os
 import settings
+from contextlib import asynccontextmanager
 from typing import Annotated
-from fastapi import FastAPI, UploadFile, File, status
-from app.routers import booking, advanced_booking
+from fastapi import BackgroundTasks, Depends, FastAPI, Request, UploadFile, File, status
+from fastapi.concurrency import run_in_threadpool
+from app.routers import admin, booking, advanced_booking
 from user.routes import router as user_routes
-from database import engine
-from startup import process_and_save_csv, save_dataframe_as_csv
+from database import ensure_schema
+from admission import ingestion_admission, reserve_threads
+from slow_queries import current_route
+from lazy_modules import lazy_import
+# Imported so that their tables are registered for `ensure_schema`
 from user import models as user_models
 from app import models as app_models
 from config import settings as stt
 
+pd = lazy_import('pandas')
+startup = lazy_import('startup')
+dataset = lazy_import('app.dataset')
+warmup = lazy_import('app.warmup')
+parallel = lazy_import('app.parallel')
+snapshots = lazy_import('app.snapshots')
+name_index = lazy_import('app.name_index')
+
+# Startup messages go to the uvicorn error log, next to uvicorn's own startup messages
+logger = logging.getLogger('uvicorn.error')
 
-# Function to delete all files in the folder on application exit
-def delete_files_in_folder_on_exit():
+
+def restore_dataset() -> None:
     """
-    Delete files in the 'app/data' folder on application exit.
+    Serve the dataset of the current snapshot (see `app.snapshots`), if there is one.
+
+    The snapshot columns are memory-mapped, so the booking endpoints work right after a restart
+    without uploading and processing the csv file again. The guest name index is rebuilt in the background.
+    """
+    entry = snapshots.current_snapshot()
+    if entry is None:
+        return
+
+    dataset.DATA_PATH = entry.get('data_path') or dataset.DATA_PATH
+    if entry['columns'] is not None and stt.ANALYTICS_MODE != 'chunked':
+        snapshots.load_snapshot(entry)
+        name_index.build_in_background()
+    elif not os.path.exists(dataset.DATA_PATH):
+        return
+
+    settings.file_uploaded = True
+    settings.dataset_fingerprint = entry['fingerprint']
+    settings.dataset_version = entry['version']
 
-    This function attempts to delete all files located in the 'app/data' folder when the application exits.
-    It iterates through the files in the folder and removes each file individually. Any errors encountered during
-    file deletion are caught and printed as error messages.
 
-    Note:
-    The function is designed to run on application exit and may not work as expected if called explicitly.
+def load_upload(csv_file: UploadFile, fingerprint: str) -> tuple[tuple, tuple | None]:
     """
-    try:
-        current_directory = os.path.dirname(__file__)
-        data_directory = os.path.join(current_directory, 'app', 'data')
-        for filename in os.listdir(data_directory):
-            file_path = os.path.join(data_directory, filename)
-            try:
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-                    print(f"File {file_path} successfully deleted")
-            except Exception as e:
-                print(f"Error deleting file {file_path}: {str(e)}")
-    except NameError:
-        pass
+    Parse an uploaded csv file, prepare the rows of the bookings table, keep a copy of it and save its snapshot.
 
+    The bookings table is written when the new dataset is switched to (see `app.warmup.switch_dataset`), so
+    the database endpoints do not serve the new data while the analytics still serve the previous one.
+    Runs in the threadpool: every step blocks (parsing, compression, snapshot files).
 
-# Register the function to be executed on application exit
-atexit.register(delete_files_in_folder_on_exit)
+    :param csv_file: The uploaded file.
+    :param fingerprint: SHA-256 of the file content.
+    :return: The result of `startup.prepare_bookings` and the dataset state (None in 'chunked' mode).
+    """
+    compression = startup.detect_compression(csv_file.file)
+    df = pd.read_csv(csv_file.file, compression=compression)
+    bookings = startup.prepare_bookings(df)
+    dataset.DATA_PATH = startup.save_upload(csv_file, compression)
+    state = None
+    if stt.ANALYTICS_MODE != 'chunked':
+        state = dataset.prepare_dataset(df)
+        with dataset.using(state) as frame:
+            snapshots.save_snapshot(frame, fingerprint[:16], fingerprint, dataset.DATA_PATH)
+    else:
+        snapshots.save_snapshot(None, fingerprint[:16], fingerprint, dataset.DATA_PATH)
+    return bookings, state
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Run the application startup and shutdown steps.
+
+    On startup the database schema is checked (once per schema version, see `database.ensure_schema`),
+    the current dataset snapshot is loaded and the startup time is compared with the `STARTUP_BUDGET` setting.
+    """
+    reserve_threads()
+    if stt.SCHEMA_CHECK:
+        ensure_schema()
+    restore_dataset()
 
-user_models.Base.metadata.create_all(engine)
-app_models.Base.metadata.create_all(engine)
+    startup_time = time.perf_counter() - _import_started
+    app.state.startup_time = startup_time
+    if startup_time > stt.STARTUP_BUDGET:
+        logger.warning("Startup took %.3fs, over the budget of %.3fs", startup_time, stt.STARTUP_BUDGET)
+    else:
+        logger.info("Startup took %.3fs", startup_time)
 
-app = FastAPI()
+    yield
+
+    if stt.ANALYTICS_MODE == 'parallel':
+        parallel.shutdown_pool()
+
+
+async def track_route(request: Request) -> None:
+    """
+    Make the route template of the request (e.g. '/bookings/{booking_id}') available to the slow statement log.
+
+    Runs as a dependency of every route, after the routing, so the matched route is read from the scope
+    instead of matching the routes again. It is async, so the value is set in the context of the request,
+    which the threadpool calls of the route copy.
+    """
+    route = request.scope.get('route')
+    current_route.set(route.path if route is not None else request.url.path)
+
+
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(track_route)])
 
 
 @app.post(
     "/upload-and-process-csv",
     tags=["CSV file upload"],
     summary="Upload booking data from csv file",
-    status_code=status.HTTP_200_OK
+    status_code=status.HTTP_200_OK,
+    dependencies=[ingestion_admission]
 )
-async def upload_and_process_csv(csv_file: Annotated[UploadFile, File(..., description="Csv file with booking data")]):
+async def upload_and_process_csv(
+        csv_file: Annotated[UploadFile, File(..., description="Csv file with booking data, optionally compressed "
+                                                              "with gzip, bz2, xz or zstd")],
+        background_tasks: BackgroundTasks
+):
     """
     Upload booking data from csv file and create filling bookings table with it.
 
-    Returns a message about result of operation.
+    The file can be compressed with gzip, bz2, xz or zstd (detected from its first bytes); it is decompressed
+    while it is parsed and kept compressed in app/data.
+    If the file has the same content as the one the loaded data was built from, it is not processed again
+    (the same csv file compressed differently counts as a different file).
+    The bookings table is filled and the analytics results of the new data are computed in the background
+    (see `app.warmup`); the endpoints switch to the new data once they are ready.
+
+    Returns a message about result of operation, the version of the new dataset and the warm-up status
+    (see GET **/upload-status**).
 
-    - **csv_file**: Csv file with booking data.
+    - **csv_file**: Csv file with booking data, optionally compressed.
     """
-    df = pd.read_csv(csv_file.file)
-    result = await process_and_save_csv(df)
-    save_dataframe_as_csv(df, csv_file.filename)
+    fingerprint = await startup.hash_upload(csv_file)
+    if settings.file_uploaded and fingerprint == settings.dataset_fingerprint:
+        return {"message": "CSV file unchanged, the loaded data is kept", "dataset_version": settings.dataset_version}
+    if warmup.status['state'] == 'warming' and fingerprint == warmup.status['fingerprint']:
+        return {"message": "CSV file is already being loaded", "dataset_version": fingerprint[:16],
+                "warm_up": dict(warmup.status)}
 
-    settings.file_uploaded = True
+    # Off the event loop, so the lookup and analytics requests admitted meanwhile keep being served
+    bookings, state = await run_in_threadpool(load_upload, csv_file, fingerprint)
+
+    background_tasks.add_task(warmup.ingest, state, bookings, fingerprint[:16], fingerprint)
 
-    return result
+    return {"message": "CSV file processed, the data is served once it is saved and warmed up",
+            "dataset_version": fingerprint[:16], "warm_up": warmup.start(fingerprint[:16], fingerprint)}
+
+
+@app.get(
+    "/upload-status",
+    tags=["CSV file upload"],
+    summary="Get the status of the last upload",
+    status_code=status.HTTP_200_OK
+)
+async def get_upload_status():
+    """
+    Get the status of the last upload.
+
+    Returns the version of the dataset the endpoints serve and the warm-up status of the last upload:
+    its state ('idle', 'warming', 'ready' or 'failed' when the bookings could not be saved), dataset version,
+    number of warmed results, analytics whose warm-up failed, warm-up duration in seconds and the partitions
+    of the bookings table that were reloaded or left unchanged.
+    """
+    warm_up = {key: value for key, value in warmup.status.items() if key != 'fingerprint'}
+    return {"dataset_version": settings.dataset_version, "warm_up": warm_up}
 
 
 app.include_router(user_routes)
+app.include_router(admin.router)
 app.include_router(advanced_booking.router)
 app.include_router(booking.router)
 
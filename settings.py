@@ -1 +1,4 @@
 file_uploaded = False
+# SHA-256 of the csv file the loaded dataset was built from, and the dataset version derived from it
+dataset_fingerprint = None
+dataset_version = None
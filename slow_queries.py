@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from sqlalchemy import event
+from config import settings as stt
+
+# Route template of the request being served, set by the `track_route` dependency in main.py
+current_route = ContextVar('current_route', default=None)
+
+# Number of slow statements kept per route by the admin endpoint
+WORST_PER_ROUTE = 10
+
+# (route, statement) -> statistics of the slow executions of the statement
+_slow = {}
+_lock = threading.Lock()
+# Plans are captured one at a time, off the request threads
+_explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='explain')
+
+
+def parameter_shape(parameters, executemany: bool = False):
+    """
+    Describe bound parameters by their types, without their values.
+
+    :param parameters: Parameters of a statement (a dictionary, a sequence, or a list of them for executemany).
+    :param executemany: Whether `parameters` holds the parameters of several executions.
+    :return: e.g. {'guest_name_1': 'str', 'param_1': 'int'}, or {'rows': 500, 'columns': {...}}.
+    """
+    if executemany:
+        return {'rows': len(parameters), 'columns': parameter_shape(parameters[0]) if parameters else None}
+    if isinstance(parameters, dict):
+        return {name: _value_shape(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_value_shape(value) for value in parameters]
+    return None
+
+
+def _value_shape(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+def _explain(engine, statement: str, parameters, key: tuple) -> None:
+    try:
+        with engine.connect() as connection:
+            connection = connection.execution_options(slow_query_log=False)
+            rows = connection.exec_driver_sql(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters).all()
+            connection.rollback()
+        plan = '\n'.join(row[0] for row in rows)
+    except Exception as error:
+        plan = f'EXPLAIN failed: {error}'
+
+    with _lock:
+        if key in _slow:
+            _slow[key]['plan'] = plan
+
+
+def _explainable(context) -> bool:
+    """
+    Tell whether a statement can be run again under EXPLAIN ANALYZE: only SELECT statements built with Core or
+    the ORM that read from a table. text() statements and table-less selects (e.g. `pg_advisory_xact_lock`)
+    may wait on locks or have side effects, which the plan capture would repeat.
+    """
+    statement = getattr(getattr(context, 'compiled', None), 'statement', None)
+    if not getattr(statement, 'is_select', False):
+        return False
+    final_froms = getattr(statement, 'get_final_froms', None)
+    return final_froms is None or bool(final_froms())
+
+
+def _record(engine, statement: str, parameters, executemany: bool, explainable: bool, elapsed_ms: float) -> None:
+    key = (current_route.get() or 'unknown', statement)
+    with _lock:
+        entry = _slow.get(key)
+        if entry is None:
+            entry = _slow[key] = {'route': key[0], 'statement': statement, 'count': 0, 'total_ms': 0.0,
+                                  'max_ms': 0.0, 'parameters': None, 'last_seen': None, 'plan': None}
+        entry['count'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['parameters'] = parameter_shape(parameters, executemany)
+        entry['last_seen'] = datetime.now(timezone.utc).isoformat()
+
+    # EXPLAIN ANALYZE runs the statement again, so only plain reads are explained
+    if not executemany and explainable and random.random() < stt.SLOW_QUERY_EXPLAIN_RATE:
+        _explainer.submit(_explain, engine, statement, parameters, key)
+
+
+def track_slow_queries(engine) -> None:
+    """
+    Time every statement of an engine and record the ones slower than the `SLOW_QUERY_THRESHOLD_MS` setting.
+
+    A slow statement is recorded per route with its number of slow executions, their total and longest
+    duration and the shape of its bound parameters. A share (`SLOW_QUERY_EXPLAIN_RATE`) of the slow Core/ORM
+    SELECT statements reading from tables is run again under `EXPLAIN (ANALYZE, BUFFERS)` in a background
+    thread to capture its plan.
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_started'].pop()) * 1000
+        if elapsed_ms >= stt.SLOW_QUERY_THRESHOLD_MS and conn.get_execution_options().get('slow_query_log', True):
+            _record(conn.engine, statement, parameters, executemany, _explainable(context), elapsed_ms)
+
+    @event.listens_for(engine, 'handle_error')
+    def drop_timer(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('query_started'):
+            connection.info['query_started'].pop()
+
+
+def worst_queries(limit: int = WORST_PER_ROUTE) -> dict:
+    """
+    Return the slowest statements of every route.
+
+    :param limit: Number of statements returned per route.
+    :return: Route -> recorded slow statements, longest execution first.
+    """
+    with _lock:
+        entries = [dict(entry) for entry in _slow.values()]
+
+    routes = {}
+    for entry in sorted(entries, key=lambda item: item['max_ms'], reverse=True):
+        statements = routes.setdefault(entry['route'], [])
+        if len(statements) < limit:
+            entry['mean_ms'] = entry['total_ms'] / entry['count']
+            statements.append(entry)
+    return routes
+
+
+def reset() -> None:
+    """
+    Forget the recorded slow statements.
+    """
+    with _lock:
+        _slow.clear()
@@ -1,15 +1,43 @@
+import gzip
+import hashlib
 import os
-from datetime import datetime
-from database import engine
+import shutil
+from fastapi import HTTPException
+from sqlalchemy import text
+from database import Base, engine
 import pandas as pd
+from app import dataset, models
+from app.calendar_dim import MONTH_NUMBERS
+from config import settings as stt
 
+# Pandas period frequency and partition name suffix of each `BOOKING_PARTITION` setting
+PARTITION_PERIODS = {'year': ('Y', '%Y'), 'month': ('M', '%Y_%m')}
 
-async def process_and_save_csv(df):
+PARTITION_LOCK_ID = 7355609
+
+# Magic bytes of the supported compression formats, as named by pandas
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+]
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz', 'zstd': '.zst'}
+
+# Retained copy of the last uploaded csv file, without its compression suffix. Only the compressed copies are
+# written (and replaced) by the server; a plain csv file at this path (e.g. the file a load test uploads)
+# is left alone.
+RETAINED_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app/data/hotel_booking_data.csv')
+
+
+def prepare_bookings(df) -> tuple[pd.DataFrame, pd.Series]:
     """
-    Process a DataFrame and save it to a SQL database.
+    Process a DataFrame into the rows of the bookings table.
+
+    The rows are saved by `save_partitions` when the new dataset is switched to (see `app.warmup`).
 
-    :param df: A pandas DataFrame containing data to be processed and saved.
-    :return: A dictionary with a success message.
+    :param df: A pandas DataFrame containing data to be processed.
+    :return: The rows of the bookings table and their booking dates, as datetimes.
     """
     selected_columns = ['name', 'adr', 'stays_in_weekend_nights', 'stays_in_week_nights', 'arrival_date_year',
                         'arrival_date_month', 'arrival_date_day_of_month', 'hotel']
@@ -25,32 +53,167 @@ async def process_and_save_csv(df):
         'arrival_date_day_of_month': 'booking_date_day',
     })
 
-    new_df['id'] = list(new_df.index)
-
-    new_df['booking_date_month'] = new_df['booking_date_month'].apply(lambda x: datetime.strptime(x, '%B').month)
-    new_df['booking_date_arrival'] = new_df.apply(
-        lambda row: datetime(row['booking_date_year'], row['booking_date_month'], row['booking_date_day']), axis=1)
-    new_df['booking_date_arrival'] = new_df['booking_date_arrival'].dt.strftime('%Y-%m-%d')
+    new_df['booking_date_month'] = new_df['booking_date_month'].map(MONTH_NUMBERS)
+    new_df['booking_date_arrival'] = pd.to_datetime(pd.DataFrame({
+        'year': new_df['booking_date_year'],
+        'month': new_df['booking_date_month'],
+        'day': new_df['booking_date_day'],
+    }))
 
-    new_df['booking_date'] = pd.to_datetime(new_df['booking_date_arrival']) - pd.to_timedelta(df['lead_time'], unit='D')
-    new_df['booking_date'] = new_df['booking_date'].dt.strftime('%Y-%m-%d')
+    booking_dates = new_df['booking_date_arrival'] - pd.to_timedelta(df['lead_time'], unit='D')
+    # The booking date is the partition key of the bookings table, so rows without one cannot be stored
+    missing = booking_dates.isna()
+    if missing.any():
+        raise HTTPException(status_code=400,
+                            detail=f"{int(missing.sum())} rows have no valid arrival date or lead time "
+                                   f"(first rows: {new_df.index[missing][:10].to_list()})")
+    new_df['booking_date'] = booking_dates.dt.date
 
     new_df['length_of_stay'] = new_df['stays_in_weekend_nights'] + new_df['stays_in_week_nights']
+    new_df['id'] = dataset.booking_ids(booking_dates, new_df['length_of_stay'], new_df['guest_name'],
+                                       new_df['daily_rate'])
 
-    new_df[['id', 'booking_date', 'length_of_stay', 'guest_name', 'daily_rate']].to_sql('bookings', engine,
-                                                                                        if_exists='replace',
-                                                                                        index=False)
-    return {"message": "CSV file processed and data saved successfully"}
+    return new_df[['id', 'booking_date', 'length_of_stay', 'guest_name', 'daily_rate']], booking_dates
 
 
-def save_dataframe_as_csv(df, filename):
+def ensure_bookings_table(connection) -> None:
     """
-    Save a DataFrame as a CSV file.
+    Make sure the bookings table exists and is partitioned.
+
+    A bookings table from before the partitioning (a plain table) or before the hashed booking ids (an integer
+    id column) is dropped and recreated.
+
+    :param connection: A connection inside a transaction.
+    """
+    relkind = connection.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('bookings')")).scalar()
+    id_type = connection.execute(text("SELECT data_type FROM information_schema.columns "
+                                      "WHERE table_name = 'bookings' AND column_name = 'id'")).scalar()
+    if relkind is not None and (relkind != 'p' or id_type != 'bigint'):
+        connection.execute(text("DROP TABLE bookings"))
+        connection.execute(text("DROP TABLE IF EXISTS booking_partitions"))
+
+    Base.metadata.create_all(connection, tables=[models.Booking.__table__, models.BookingPartition.__table__])
+
 
-    :param df: A pandas DataFrame to be saved.
-    :param filename: The name of the CSV file.
+def partition_fingerprint(rows: pd.DataFrame) -> str:
     """
-    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app/data")
+    Compute the SHA-256 fingerprint of the rows of a partition.
+    """
+    hashes = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+    return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+
+def save_partitions(bookings: pd.DataFrame, booking_dates: pd.Series) -> tuple[list, list]:
+    """
+    Save bookings into the partitions of the bookings table.
+
+    The rows are split by booking date into one partition per year or month (`BOOKING_PARTITION` setting);
+    missing partitions are created. A partition is reloaded (truncated and filled, in its own transaction)
+    only when its rows differ from the ones it was last loaded with, so uploading a file in which one year
+    changed does not rewrite the other years (the booking ids do not depend on the row positions in the file,
+    see `dataset.booking_ids`). Partitions of periods without bookings in the file are dropped.
+
+    :param bookings: The rows of the bookings table.
+    :param booking_dates: The booking dates of the rows, as datetimes.
+    :return: The names of the reloaded partitions and the names of the unchanged ones.
+    """
+    frequency, suffix = PARTITION_PERIODS[stt.BOOKING_PARTITION]
+    periods = booking_dates.dt.to_period(frequency)
+
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {'lock_id': PARTITION_LOCK_ID})
+        ensure_bookings_table(connection)
+        stored = dict(connection.execute(text("SELECT name, fingerprint FROM booking_partitions")).all())
+
+        partitions = {f"bookings_{period.strftime(suffix)}": (period, rows)
+                      for period, rows in bookings.groupby(periods, sort=True)}
+        for name in stored.keys() - partitions.keys():
+            connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            connection.execute(text("DELETE FROM booking_partitions WHERE name = :name"), {'name': name})
+
+    reloaded, unchanged = [], []
+    for name, (period, rows) in partitions.items():
+        fingerprint = partition_fingerprint(rows)
+        if stored.get(name) == fingerprint:
+            unchanged.append(name)
+            continue
 
-    output_path = os.path.join(data_dir, filename)
-    df.to_csv(output_path, index=False)
+        date_from, date_to = period.start_time.date(), (period + 1).start_time.date()
+        with engine.begin() as connection:
+            connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {'lock_id': PARTITION_LOCK_ID})
+            connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF bookings "
+                                    f"FOR VALUES FROM ('{date_from}') TO ('{date_to}')"))
+            connection.execute(text(f"TRUNCATE {name}"))
+            rows.to_sql(name, connection, if_exists='append', index=False, chunksize=10000)
+            connection.execute(text("INSERT INTO booking_partitions (name, date_from, date_to, fingerprint, rows) "
+                                    "VALUES (:name, :date_from, :date_to, :fingerprint, :rows) "
+                                    "ON CONFLICT (name) DO UPDATE SET fingerprint = excluded.fingerprint, "
+                                    "rows = excluded.rows"),
+                               {'name': name, 'date_from': date_from, 'date_to': date_to,
+                                'fingerprint': fingerprint, 'rows': len(rows)})
+        reloaded.append(name)
+
+    return reloaded, unchanged
+
+
+def detect_compression(file) -> str | None:
+    """
+    Detect the compression of a file from its magic bytes.
+
+    :param file: A seekable binary file object; it is rewound afterwards.
+    :return: 'gzip', 'bz2', 'xz' or 'zstd' (the pandas name of the format), or None for an uncompressed file.
+    """
+    head = file.read(6)
+    file.seek(0)
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def save_upload(upload_file, compression: str | None) -> str:
+    """
+    Keep a compressed copy of the uploaded csv file in app/data.
+
+    A compressed upload is copied as it is; an uncompressed one is gzip-compressed while it is copied, at a
+    low compression level (the copy is written while the upload request waits). Copies of previous uploads in
+    other compression formats are removed.
+
+    :param upload_file: The uploaded file (fastapi.UploadFile).
+    :param compression: Compression of the upload (see `detect_compression`).
+    :return: Path of the copy (its suffix tells pandas how to decompress it).
+    """
+    path = RETAINED_CSV + COMPRESSION_SUFFIXES[compression or 'gzip']
+    temporary_path = path + '.tmp'
+    # app/data is not part of the repository
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    upload_file.file.seek(0)
+    with (open(temporary_path, 'wb') if compression else gzip.open(temporary_path, 'wb', compresslevel=1)) as target:
+        shutil.copyfileobj(upload_file.file, target, 1 << 20)
+    os.replace(temporary_path, path)
+
+    for stale_path in [RETAINED_CSV + suffix for suffix in COMPRESSION_SUFFIXES.values()]:
+        if stale_path != path and os.path.exists(stale_path):
+            os.remove(stale_path)
+    return path
+
+
+async def hash_upload(upload_file, chunk_size: int = 1 << 20) -> str:
+    """
+    Compute the SHA-256 fingerprint of an uploaded file.
+
+    The file is read in chunks, so it is never held in memory as a whole, and rewound afterwards.
+    The bytes are hashed as uploaded: the same csv file uploaded with another compression gets another
+    fingerprint and is processed again (the partitions of the bookings table whose rows did not change are
+    still not reloaded, see `save_partitions`).
+
+    :param upload_file: The uploaded file (fastapi.UploadFile).
+    :param chunk_size: Number of bytes read at a time.
+    :return: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    while chunk := await upload_file.read(chunk_size):
+        digest.update(chunk)
+    await upload_file.seek(0)
+    return digest.hexdigest()
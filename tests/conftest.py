@@ -0,0 +1,42 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+# The settings are read when `config` is imported; the tests don't connect to the database
+for name, value in {'DB_HOST': 'localhost', 'DB_PORT': '5432', 'DB_USER': 'postgres', 'DB_PASS': 'postgres',
+                    'DB_NAME': 'hotel_bookings', 'HOST': '127.0.0.1', 'PORT': '8000'}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def bookings() -> pd.DataFrame:
+    """A few rows in the format of the uploaded csv file."""
+    return pd.DataFrame({
+        'hotel': ['Resort Hotel', 'City Hotel', 'City Hotel', 'Resort Hotel'],
+        'is_canceled': [0, 1, 0, 0],
+        'lead_time': [10, 3, 30, 0],
+        'arrival_date_year': [2016, 2016, 2016, 2017],
+        'arrival_date_month': ['July', 'July', 'August', 'January'],
+        'arrival_date_day_of_month': [1, 15, 2, 20],
+        'stays_in_weekend_nights': [1, 0, 2, 0],
+        'stays_in_week_nights': [2, 1, 3, 4],
+        'adults': [2, 1, 2, 2],
+        'children': [0, 0, 1, 0],
+        'babies': [0, 0, 0, 0],
+        'meal': ['BB', 'HB', 'BB', 'SC'],
+        'country': ['PRT', 'GBR', None, 'PRT'],
+        'is_repeated_guest': [0, 0, 1, 0],
+        'adr': [100.0, 80.5, 120.0, 95.0],
+        'name': ['Ann Smith', 'Bob Jones', 'Ann Smith', 'Carl White'],
+    })
+
+
+@pytest.fixture
+def loaded(bookings):
+    """Serve `bookings` as the in-memory dataset for the duration of a test."""
+    from app import dataset
+
+    with dataset.using(dataset.prepare_dataset(bookings)) as frame:
+        yield frame
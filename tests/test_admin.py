@@ -0,0 +1,20 @@
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+import auth_dep
+from config import settings as stt
+
+
+def test_registered_user_is_not_admin(monkeypatch):
+    monkeypatch.setattr(stt, 'ADMIN_USERNAMES', ['admin'])
+
+    with pytest.raises(HTTPException) as error:
+        auth_dep.verify_admin(SimpleNamespace(username='loadtest'))
+    assert error.value.status_code == 403
+
+
+def test_listed_user_is_admin(monkeypatch):
+    monkeypatch.setattr(stt, 'ADMIN_USERNAMES', ['admin'])
+    user = SimpleNamespace(username='admin')
+
+    assert auth_dep.verify_admin(user) is user
@@ -0,0 +1,27 @@
+import asyncio
+import admission
+from user.routes import router as user_routes
+
+
+def test_user_import_has_its_own_class():
+    bulk = next(route for route in user_routes.routes if route.path.endswith('/bulk'))
+
+    assert admission.import_admission in bulk.dependencies
+    assert admission.CLASSES['import'] is not admission.CLASSES['ingestion']
+
+
+def test_user_import_is_not_held_up_by_a_csv_upload():
+    ingestion, imports = admission.CLASSES['ingestion'], admission.CLASSES['import']
+
+    async def scenario():
+        for _ in range(ingestion.concurrency):
+            await ingestion.acquire()
+        try:
+            # Admitted right away while every ingestion slot is taken
+            await asyncio.wait_for(imports.acquire(), 0.1)
+            imports.release()
+        finally:
+            for _ in range(ingestion.concurrency):
+                ingestion.release()
+
+    asyncio.run(scenario())
@@ -0,0 +1,15 @@
+import json
+from app import cube
+from app.schemas import CubeQuery
+
+
+def test_missing_dimension_value_is_null(loaded):
+    result = cube.query_cube(CubeQuery(group_by=('country',)))
+
+    assert {row['country']: row['bookings'] for row in result} == {'GBR': 1, 'PRT': 2, None: 1}
+    # The response is serialized without NaN
+    json.dumps(result, allow_nan=False)
+
+
+def test_roll_up_over_all_dimensions(loaded):
+    assert cube.query_cube(CubeQuery(hotel=('City Hotel',)))[0]['bookings'] == 2
@@ -0,0 +1,26 @@
+import pandas as pd
+from app import dataset
+
+
+def ids_of(frame: pd.DataFrame) -> pd.Series:
+    return pd.Series(dataset.derive_columns(frame.copy())['id'].to_numpy(), index=frame['name'])
+
+
+def test_booking_ids_fit_in_53_bits(bookings):
+    ids = ids_of(bookings)
+
+    assert ids.between(0, dataset.MAX_BOOKING_ID).all()
+    assert ids.is_unique
+
+
+def test_booking_ids_do_not_depend_on_other_rows(bookings):
+    ids = ids_of(bookings)
+
+    # The first row removed: the ids of the other rows stay the same
+    assert ids_of(bookings.iloc[1:]).equals(ids.iloc[1:])
+
+
+def test_identical_bookings_get_distinct_ids(bookings):
+    ids = ids_of(pd.concat([bookings, bookings.iloc[:1]], ignore_index=True))
+
+    assert ids.is_unique
@@ -0,0 +1,35 @@
+import json
+from datetime import date
+from app import dependencies
+from app.schemas import DateRange
+
+EMPTY_RANGE = DateRange(date_from=date(2020, 1, 1), date_to=date(2020, 12, 31))
+
+
+def test_stats_calculation_empty_range(loaded):
+    result = dependencies.stats_calculation(EMPTY_RANGE)
+
+    assert result == {
+        'number_of_bookings': 0,
+        'average_length_of_stay': None,
+        'average_daily_rate': None,
+        'ten_most_common_guests': [],
+        'ten_most_popular_dates': []
+    }
+
+
+def test_analysis_calculation_empty_range(loaded):
+    result = dependencies.analysis_calculation(EMPTY_RANGE)
+
+    assert result['booking_trends_by_month'] == {}
+    assert result['analysis']['adr']['count'] == 0
+    assert result['analysis']['adr']['mean'] is None
+    # The response is serialized without NaN
+    json.dumps(result['analysis'], allow_nan=False)
+
+
+def test_analysis_calculation_single_row(loaded):
+    result = dependencies.analysis_calculation(DateRange(date_from=date(2017, 1, 20), date_to=date(2017, 1, 20)))
+
+    assert result['analysis']['adr']['mean'] == 95.0
+    assert result['analysis']['adr']['std'] is None
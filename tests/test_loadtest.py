@@ -0,0 +1,18 @@
+import random
+from loadtest import runner
+
+
+def test_booking_ids_are_drawn_from_fetched_ids():
+    scenario = runner.load_scenario('loadtest/scenarios/mixed.yaml')
+    request = next(request for request in scenario['requests'] if request['path'] == '/bookings/{booking_id}')
+    spec = request['vars']['booking_id']
+
+    # Not a range of row positions: the ids come from the bookings page fetched before the run
+    assert spec['from'] == '/bookings/' and spec['field'] == 'id'
+    spec['values'] = [2 ** 52 + 1, 7]
+    random.seed(0)
+    assert {runner.draw(spec) for _ in range(20)} == {2 ** 52 + 1, 7}
+
+
+def test_range_vars():
+    assert 3 <= runner.draw([3, 5]) <= 5
@@ -0,0 +1,31 @@
+import pytest
+from app import dependencies, parallel
+
+
+@pytest.fixture
+def one_row_blocks(monkeypatch):
+    # Every row is a block of its own, so every aggregate goes through a merge
+    monkeypatch.setattr(parallel, 'BLOCK_SIZE', 1)
+
+
+def test_stats_calculation_matches_memory_mode(loaded, one_row_blocks):
+    expected = dependencies.stats_calculation.__wrapped__(None)
+
+    result = parallel.compute('stats_calculation', None, workers=1)
+
+    assert result['ten_most_common_guests'] == expected['ten_most_common_guests']
+    assert result['ten_most_popular_dates'] == expected['ten_most_popular_dates']
+    assert result['number_of_bookings'] == expected['number_of_bookings']
+    assert result['average_daily_rate'] == pytest.approx(expected['average_daily_rate'])
+
+
+def test_analysis_calculation_quartiles_are_exact(loaded, one_row_blocks):
+    expected = dependencies.analysis_calculation.__wrapped__(None)['analysis']
+
+    result = parallel.compute('analysis_calculation', None, workers=1)['analysis']
+
+    assert result.keys() == expected.keys()
+    for column, statistics in expected.items():
+        assert [result[column][name] for name in ('min', '25%', '50%', '75%', 'max')] == \
+            [statistics[name] for name in ('min', '25%', '50%', '75%', 'max')]
+        assert result[column]['mean'] == pytest.approx(statistics['mean'])
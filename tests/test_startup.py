@@ -0,0 +1,15 @@
+import gzip
+import io
+from types import SimpleNamespace
+import startup
+
+
+def test_save_upload_creates_the_data_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(startup, 'RETAINED_CSV', str(tmp_path / 'data' / 'hotel_booking_data.csv'))
+    content = b'hotel,adr\nCity Hotel,80.5\n'
+
+    path = startup.save_upload(SimpleNamespace(file=io.BytesIO(content)), None)
+
+    assert path == str(tmp_path / 'data' / 'hotel_booking_data.csv.gz')
+    with gzip.open(path) as file:
+        assert file.read() == content
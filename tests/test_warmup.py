@@ -0,0 +1,42 @@
+import pytest
+import settings
+import startup
+from app import dataset, warmup
+
+
+@pytest.fixture
+def ingestion(bookings, monkeypatch):
+    monkeypatch.setattr(warmup, 'warm_results', lambda version: (0, []))
+    monkeypatch.setattr(settings, 'dataset_version', 'old')
+    monkeypatch.setattr(dataset, '_state', None)
+    warmup.start('new', 'new' * 16)
+    return dataset.prepare_dataset(bookings), (None, None)
+
+
+def test_bookings_are_saved_before_the_switch(ingestion, monkeypatch):
+    served_during_write = []
+
+    def save_partitions(rows, booking_dates):
+        served_during_write.append(settings.dataset_version)
+        return ['bookings_2016'], ['bookings_2017']
+
+    monkeypatch.setattr(startup, 'save_partitions', save_partitions)
+    warmup.ingest(*ingestion, 'new', 'new' * 16)
+
+    # The analytics switched right after the database write, not before it
+    assert served_during_write == ['old']
+    assert settings.dataset_version == 'new'
+    assert warmup.status['state'] == 'ready'
+    assert warmup.status['partitions_reloaded'] == ['bookings_2016']
+
+
+def test_failed_write_keeps_the_previous_version(ingestion, monkeypatch):
+    def save_partitions(rows, booking_dates):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(startup, 'save_partitions', save_partitions)
+    warmup.ingest(*ingestion, 'new', 'new' * 16)
+
+    assert settings.dataset_version == 'old'
+    assert dataset._state is None
+    assert warmup.status['state'] == 'failed'
@@ -1,3 +1,5 @@
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from . import models, schemas
 
@@ -78,6 +80,47 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 
+def get_conflicting_users(db: Session, usernames: list[str], user_emails: list[str]):
+    """
+    Get the users whose username or email address is in the given lists, with a single query.
+
+    Args:
+        db (Session): The database session.
+        usernames (list[str]): Usernames to look for.
+        user_emails (list[str]): Email addresses to look for.
+
+    Returns:
+        list: A list of (username, email) rows of the matching users.
+    """
+    query = select(models.User.username, models.User.email).where(
+        or_(models.User.username.in_(usernames), models.User.email.in_(user_emails)))
+    return db.execute(query).all()
+
+
+def create_users(db: Session, users: list[schemas.UserCreate]):
+    """
+    Create several users with one INSERT statement in one transaction.
+
+    Rows whose username or email address is already taken (e.g. by a user created concurrently) are skipped
+    by the database (ON CONFLICT DO NOTHING) instead of failing the whole statement.
+
+    Args:
+        db (Session): The database session.
+        users (list[schemas.UserCreate]): The user data to create.
+
+    Returns:
+        list: The created user objects; the skipped rows are missing from it.
+    """
+    if not users:
+        return []
+
+    rows = [{'username': user.username, 'email': user.email, 'password': user.password} for user in users]
+    query = insert(models.User).values(rows).on_conflict_do_nothing().returning(models.User)
+    db_users = db.scalars(query).all()
+    db.commit()
+    return db_users
+
+
 def delete_user(db: Session, user: schemas.UserDelete):
     """
     Delete a user from the database.
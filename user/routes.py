@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Query, Path
+from fastapi import APIRouter, HTTPException, Query, Path, status
 from typing import Annotated
 from . import db_queries, schemas
 from database import db_dependencies
 from auth_dep import auth_dependencies
+from admission import import_admission
+from config import settings as stt
 
 router = APIRouter(
     prefix='/users',
@@ -11,7 +13,7 @@ router = APIRouter(
 
 
 @router.get('/', response_model=list[schemas.User])
-async def get_all_users(
+def get_all_users(
         db: db_dependencies, skip: Annotated[int | None, Query(title="Number of values to skip",
                                                                description="Number of values to skip (from the beginning)")] = 0,
         limit: Annotated[int | None, Query(title="Limit number of entries",
@@ -32,7 +34,7 @@ async def get_all_users(
 
 
 @router.post('/', response_model=schemas.User)
-async def create_user(user: schemas.UserCreate, db: db_dependencies):
+def create_user(user: schemas.UserCreate, db: db_dependencies):
     """
     Create a new user.
 
@@ -56,8 +58,63 @@ async def create_user(user: schemas.UserCreate, db: db_dependencies):
     return db_queries.create_user(db=db, user=user)
 
 
+@router.post('/bulk', response_model=schemas.UserImportResult, dependencies=[import_admission])
+def import_users(users: list[schemas.UserCreate], db: db_dependencies):
+    """
+    Create many users at once.
+
+    Usernames and email addresses are checked against the database with one query and inserted with one
+    statement; rows that clash with existing users or with an earlier row of the same batch are skipped.
+    Rows taken by users created between the check and the insert are skipped by the insert and reported
+    as conflicts too.
+
+    Parameters:
+    - **users** (list[schemas.UserCreate]): Users to create (at most `USER_IMPORT_MAX_ROWS`).
+    - **db** (db_dependencies): Dependency to obtain a database session.
+
+    Returns:
+        schemas.UserImportResult: The created users and the rejected rows with the reason.
+
+    Possible Errors:
+        HTTP 413: Too many users in one import.
+    """
+    if len(users) > stt.USER_IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {stt.USER_IMPORT_MAX_ROWS} users can be imported at once")
+
+    existing = db_queries.get_conflicting_users(db, usernames=[user.username for user in users],
+                                                user_emails=[user.email for user in users])
+    taken_usernames = {row.username for row in existing}
+    taken_emails = {row.email for row in existing}
+
+    accepted = []
+    conflicts = []
+    for index, user in enumerate(users):
+        if user.email in taken_emails:
+            detail = "Email already registered"
+        elif user.username in taken_usernames:
+            detail = "Username already registered"
+        else:
+            accepted.append((index, user))
+            taken_usernames.add(user.username)
+            taken_emails.add(user.email)
+            continue
+        conflicts.append(schemas.UserImportConflict(index=index, username=user.username, email=user.email,
+                                                    detail=detail))
+
+    created = db_queries.create_users(db=db, users=[user for _, user in accepted])
+    created_usernames = {db_user.username for db_user in created}
+    for index, user in accepted:
+        if user.username not in created_usernames:
+            conflicts.append(schemas.UserImportConflict(index=index, username=user.username, email=user.email,
+                                                        detail="Username or email already registered"))
+    conflicts.sort(key=lambda conflict: conflict.index)
+
+    return {'created': created, 'conflicts': conflicts}
+
+
 @router.delete('/', response_model=schemas.User)
-async def delete_user(credentials: auth_dependencies, user: schemas.UserDelete, db: db_dependencies):
+def delete_user(credentials: auth_dependencies, user: schemas.UserDelete, db: db_dependencies):
     """
     Delete a user.
 
@@ -79,7 +136,7 @@ async def delete_user(credentials: auth_dependencies, user: schemas.UserDelete,
 
 
 @router.put('/{user_id}', response_model=schemas.User)
-async def update_user(
+def update_user(
         credentials: auth_dependencies, user_id: Annotated[
             int, Path(..., title="User ID", description="The ID of user to retrieve", ge=0)],
         user: schemas.UserCreate, db: db_dependencies
@@ -23,3 +23,15 @@ class UserCreate(BaseModel):
 class UserDelete(BaseModel):
     username: str
     password: str
+
+
+class UserImportConflict(BaseModel):
+    index: int
+    username: str
+    email: str
+    detail: str
+
+
+class UserImportResult(BaseModel):
+    created: list[User]
+    conflicts: list[UserImportConflict]